@@ -0,0 +1,223 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import numpy as np
+
+
+ACTIVATIONS = {} # name -> (activation, derivative) pairs.
+
+
+def register(name, func, deriv):
+	"""
+	Register an activation function and its derivative under the given name.
+
+	Args:
+	-----
+		name: String repr. the activation i.e the outputType of a layer.
+		func: Function (data, out=None) returning the activations of data.
+		deriv: Function (y, dEdo, out=None) returning dEdo times the derivative
+			of func, written in terms of the activations y = func(data).
+	"""
+	ACTIVATIONS[name] = (func, deriv)
+
+
+def sigmoid(data, out=None):
+	"""
+	Run The sigmoid activation function over the input data. exp(-x) may
+	overflow to inf for large negative inputs, which still gives the correct
+	limit of 0, so the overflow is silenced rather than guarded against.
+
+	Args:
+	----
+		data : A k x N array.
+		out: Optional array to write the result to, may be data itself.
+
+	Returns:
+	-------
+		A k x N array.
+	"""
+	out = np.negative(data, out=out)
+	with np.errstate(over='ignore'):
+		np.exp(out, out=out)
+	np.add(out, 1, out=out)
+	np.reciprocal(out, out=out)
+	return out
+
+
+def softmax(data, out=None):
+	"""
+	Run the softmax activation function over the input data, shifting each
+	column by its max so large logits do not overflow.
+
+	Args:
+	----
+		data : A k x N array.
+		out: Optional array to write the result to, may be data itself.
+
+	Returns:
+	-------
+		A k x N array.
+	"""
+	out = np.subtract(data, np.max(data, axis=0, keepdims=True), out=out)
+	np.exp(out, out=out)
+	out /= np.sum(out, axis=0, keepdims=True)
+	return out
+
+
+def tanh(data, out=None):
+	"""
+	Run the hyperbolic tangent activation function over the input data.
+
+	Args:
+	-----
+		data : A k x N array.
+		out: Optional array to write the result to, may be data itself.
+
+	Returns:
+	--------
+		A k x N array.
+	"""
+	return np.tanh(data, out=out)
+
+
+def sech2(y, out=None):
+	"""
+	Find the square of the hyperbolic secant function from the tanh
+	activations y as 1 - y^2, without recomputing tanh.
+
+	Args:
+	-----
+		y : A k x N array of tanh activations.
+		out: Optional array to write the result to, may be y itself.
+
+	Returns:
+	--------
+		A k x N array.
+	"""
+	out = np.square(y, out=out)
+	np.subtract(1, out, out=out)
+	return out
+
+
+def relu(data, out=None):
+	"""
+	Perform rectilinear activation on the data.
+
+	Args:
+	-----
+		data: A k x N array.
+		out: Optional array to write the result to, may be data itself.
+
+	Returns:
+	--------
+		A k x N array.
+	"""
+	return np.maximum(data, 0, out=out)
+
+
+def linear(data, out=None):
+	"""
+	Perform the identity activation on the data.
+
+	Args:
+	-----
+		data: A k x N array.
+		out: Optional array to write the result to, may be data itself.
+
+	Returns:
+	--------
+		A k x N array.
+	"""
+	if out is None or out is data:
+		return data
+
+	out[...] = data
+	return out
+
+
+def dsigmoid(y, dEdo, out=None):
+	"""
+	Backpropagate errors through the sigmoid activation.
+
+	Args:
+	-----
+		y: A k x N array of sigmoid activations.
+		dEdo: A k x N array of errors w.r.t the activations.
+		out: Optional array to write the result to, may be dEdo itself.
+
+	Returns:
+	--------
+		A k x N array of errors w.r.t the sigmoid inputs.
+	"""
+	ny = np.subtract(1, y)
+	out = np.multiply(dEdo, y, out=out)
+	out *= ny
+	return out
+
+
+def dtanh(y, dEdo, out=None):
+	"""
+	Backpropagate errors through the tanh activation using sech^2 = 1 - y^2.
+
+	Args:
+	-----
+		y: A k x N array of tanh activations.
+		dEdo: A k x N array of errors w.r.t the activations.
+		out: Optional array to write the result to, may be dEdo itself.
+
+	Returns:
+	--------
+		A k x N array of errors w.r.t the tanh inputs.
+	"""
+	return np.multiply(dEdo, sech2(y), out=out)
+
+
+def drelu(y, dEdo, out=None):
+	"""
+	Backpropagate errors through the rectilinear activation.
+
+	Args:
+	-----
+		y: A k x N array of relu activations.
+		dEdo: A k x N array of errors w.r.t the activations.
+		out: Optional array to write the result to, may be dEdo itself.
+
+	Returns:
+	--------
+		A k x N array of errors w.r.t the relu inputs.
+	"""
+	return np.multiply(dEdo, y > 0, out=out)
+
+
+def dlinear(y, dEdo, out=None):
+	"""
+	Backpropagate errors through the identity activation.
+
+	Args:
+	-----
+		y: A k x N array of activations.
+		dEdo: A k x N array of errors w.r.t the activations.
+		out: Optional array to write the result to, may be dEdo itself.
+
+	Returns:
+	--------
+		A k x N array of errors w.r.t the activation inputs.
+	"""
+	return linear(dEdo, out)
+
+
+register('sigmoid', sigmoid, dsigmoid)
+register('tanh', tanh, dtanh)
+register('relu', relu, drelu)
+register('linear', linear, dlinear)
@@ -0,0 +1,198 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+from convae import *
+from retrieval import *
+from plan import *
+
+
+def timeit(func, repeats=5):
+	"""
+	Time the given function.
+
+	Args:
+	-----
+		func: Function taking no arguments.
+		repeats: No. times to run func.
+
+	Returns:
+	--------
+		The best wall time in seconds over all the runs.
+	"""
+	best = float('inf')
+	for i in xrange(repeats):
+		start = time.time()
+		func()
+		best = min(best, time.time() - start)
+
+	return best
+
+
+def benchThreads(max_threads=None, batch_size=500):
+	"""
+	Benchmark the scaling of the sharded layer ops from 1 to max_threads threads.
+
+	Args:
+	-----
+		max_threads: Integer repr. max no. threads. Defaults to the no. cpus.
+		batch_size: Integer repr. no. images in the benchmark batch.
+	"""
+	max_threads = max_threads or multiprocessing.cpu_count()
+	maps = np.random.randn(batch_size, 6, 32, 32)
+	pooled = np.random.randn(batch_size, 6, 16, 16)
+
+	maxPool, avgPool = PoolLayer((2, 2), 'max'), PoolLayer((2, 2), 'avg')
+	unPool = PoolLayer((2, 2), 'avg', True)
+	conv = ConvLayer(6, 1, (3, 3), outputType='tanh')
+
+	ops = [
+		('max pool feedf', lambda: maxPool.feedf(maps)),
+		('max pool bprop', lambda: maxPool.bprop(pooled)),
+		('avg pool feedf', lambda: avgPool.feedf(maps)),
+		('avg pool bprop', lambda: avgPool.bprop(pooled)),
+		('unpool bprop', lambda: unPool.bprop(maps)),
+		('tanh feedf', lambda: shardApply(conv.activate, acts)),
+		('tanh bprop', lambda: shardApply(conv.deriv, maps, maps, np.empty_like(maps))),
+	]
+	maxPool.feedf(maps) # record positions for bprop.
+	acts = maps.copy() # activated in place, so kept apart from maps.
+
+	print "Batch size: %d" % batch_size
+	print "| {:16s} | {:>7s} | {:>9s} | {:>7s} |".format('op', 'threads', 'time (ms)', 'speedup')
+	for name, op in ops:
+		base = None
+		for threads in xrange(1, max_threads + 1):
+			setThreads(threads)
+			t = timeit(op)
+			base = base or t
+			print "| {:16s} | {:7d} | {:9.2f} | {:7.2f} |".format(name, threads, t * 1000, base / t)
+
+	setThreads(1)
+
+
+def benchActivations(shape=(500, 6, 30, 30)):
+	"""
+	Benchmark each registered activation and its derivative against the
+	temporary allocating forms they replaced.
+
+	Args:
+	-----
+		shape: Tuple repr. shape of the benchmark feature maps.
+	"""
+	data = np.random.randn(*shape).astype('float32')
+	logits = 50 * data.reshape(shape[0], -1).T
+	y, dEdo, out = np.tanh(data), np.random.randn(*shape).astype('float32'), np.empty(shape, dtype='float32')
+
+	ops = [
+		('sigmoid', lambda: 1 / (1 + np.exp(-data)), lambda: sigmoid(data, out)),
+		('softmax', lambda: np.exp(logits) / np.sum(np.exp(logits), axis=0), lambda: softmax(logits, out.reshape(logits.shape[1], -1).T)),
+		('tanh', lambda: np.tanh(data), lambda: tanh(data, out)),
+		('relu', lambda: np.maximum(data, 0), lambda: relu(data, out)),
+		('sech2', lambda: np.square(1 / np.cosh(data)), lambda: sech2(y, out)),
+		('dsigmoid', lambda: dEdo * y * (1 - y), lambda: dsigmoid(y, dEdo, out)),
+		('dtanh', lambda: dEdo * np.square(1 / np.cosh(data)), lambda: dtanh(y, dEdo, out)),
+		('drelu', lambda: dEdo * np.where(data > 0, 1, 0), lambda: drelu(y, dEdo, out)),
+	]
+
+	print "Feature maps: %s" % (shape,)
+	print "| {:10s} | {:>10s} | {:>10s} | {:>7s} |".format('activation', 'old (ms)', 'new (ms)', 'speedup')
+	for name, old, new in ops:
+		t_old, t_new = timeit(old), timeit(new)
+		print "| {:10s} | {:10.2f} | {:10.2f} | {:7.2f} |".format(name, t_old * 1000, t_new * 1000, t_old / t_new)
+
+
+def benchRetrieval(model=None, k=10):
+	"""
+	Benchmark recall and queries/sec of the code index against exact search
+	on the Toronto Faces dataset.
+
+	Args:
+	-----
+		model: String repr. a saved model file. Defaults to an untrained network.
+		k: Integer repr. no. neighbours per query.
+	"""
+	data = np.load('data/faces.npz')
+	corpus = np.transpose(data['train_data'], (2, 0, 1)).reshape(2925, 32, 32, 1)
+	queries = np.transpose(data['test_data'], (2, 0, 1)).reshape(418, 32, 32, 1)
+
+	ae = ConvAE()
+	if model is not None:
+		ae.loadModel(model)
+	else:
+		for layer in [PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (3, 3), outputType='linear')]:
+			ae.layers = ae.reflect(layer) + ae.layers + [layer]
+
+	tmp = tempfile.mkdtemp()
+	print "| {:7s} | {:>5s} | {:>6s} | {:>8s} | {:>9s} |".format('codes', 'lists', 'probes', 'recall', 'queries/s')
+	for quantize in [False, True]:
+		index = CodeIndex(ae, os.path.join(tmp, 'codes.npy'), quantize)
+		index.build(corpus)
+		if not quantize:
+			start = time.time()
+			truth, x = index.exact(queries, k)
+			print "| {:7s} | {:>5s} | {:>6s} | {:8.3f} | {:9.1f} |".format('float32', '-', '-', 1.0, len(queries) / (time.time() - start))
+
+		for probes in [1, 2, 4, 8]:
+			index.probes = probes
+			start = time.time()
+			found, x = index.query(queries, k)
+			qps = len(queries) / (time.time() - start)
+			print "| {:7s} | {:5d} | {:6d} | {:8.3f} | {:9.1f} |".format('int8' if quantize else 'float32', index.no_lists, probes, recall(found, truth), qps)
+
+		del index # close the memory map.
+	os.remove(os.path.join(tmp, 'codes.npy'))
+	os.rmdir(tmp)
+
+
+def benchPlan(batch_size=100, model=None):
+	"""
+	Benchmark a frozen inference plan against ConvAE.feedf on Toronto Faces
+	sized images.
+
+	Args:
+	-----
+		batch_size: Integer repr. no. images fed through at once.
+		model: String repr. a saved model file. Defaults to an untrained network,
+			with weights large enough that its outputs are not vanishingly small.
+	"""
+	ae = ConvAE()
+	if model is not None:
+		ae.loadModel(model)
+	else:
+		for layer in [PoolLayer((2, 2), 'max'), ConvLayer(16, 6, (3, 3), init_w=0.1), ConvLayer(6, 1, (5, 5), outputType='tanh', init_w=0.1)]:
+			ae.layers = ae.reflect(layer) + ae.layers + [layer]
+
+	imgs = np.random.rand(batch_size, 32, 32, 1)
+	plan = freeze(ae.layers, imgs.shape)
+
+	t_feedf, t_plan = timeit(lambda: ae.feedf(ae.layers, imgs, False)), timeit(lambda: plan.run(imgs))
+	recon = ae.feedf(ae.layers, imgs, False)
+	scale = np.max(np.absolute(recon))
+	print "Batch size: %d, max abs output: %g, max abs difference relative to it: %g" % (batch_size, scale, np.max(np.absolute(recon - plan.run(imgs))) / scale)
+	print "| {:10s} | {:>9s} | {:>7s} |".format('', 'time (ms)', 'speedup')
+	print "| {:10s} | {:9.2f} | {:7.2f} |".format('feedf', t_feedf * 1000, 1.0)
+	print "| {:10s} | {:9.2f} | {:7.2f} |".format('plan', t_plan * 1000, t_feedf / t_plan)
+
+
+if __name__ == '__main__':
+
+	benchThreads()
+	benchActivations()
+	benchRetrieval()
+	benchPlan()
@@ -14,6 +14,7 @@
 
 import time
 import random
+import threading
 import numpy as np
 import theano as thn
 import theano.tensor as tn
@@ -22,73 +23,17 @@ import matplotlib.pyplot as plt
 import cPickle as cpkl
 from theano import shared
 from theano.tensor.signal.conv import conv2d as conv2
-from theano.tensor.signal.downsample import max_pool_2d as max_pool
-from theano.tensor.signal.downsample import max_pool_2d_same_size as max_pool_same
 from skimage.transform import downscale_local_mean as downsample
-from copy import deepcopy
+from copy import copy, deepcopy
+from multiprocessing.pool import ThreadPool
 from util import *
+from activations import *
+from snapshots import *
 
 
-def sigmoid(data):
-	"""
-	Run The sigmoid activation function over the input data.
-
-	Args:
-	----
-		data : A k x N array.
-
-	Returns:
-	-------
-		A k x N array.
-	"""
-	return 1 / (1 + np.exp(-data))
-
-
-def softmax(data):
-	"""
-	Run the softmax activation function over the input data.
-
-	Args:
-	----
-		data : A k x N array.
-
-	Returns:
-	-------
-		A k x N array.
-	"""
-	k, N = data.shape
-	e = np.exp(data)
-	return e/np.sum(e, axis=0).reshape(1, N)
-
-
-def sech2(data):
-	"""
-	Find the hyperbolic secant function over the input data.
-
-	Args:
-	-----
-		data : A k x N array.
-
-	Returns:
-	--------
-		A k x N array.
-	"""
-	return np.square(1 / np.cosh(data))
-
-
-def relu(data):
-	"""
-	Perform rectilinear activation on the data.
-
-	Args:
-	-----
-		data: A k x N array.
-
-	Returns:
-	--------
-		A k x N array.
-	"""
-	return np.maximum(data, 0)
+_pool, _threads = None, 1 # worker threads shared by all layer ops.
+_heapSlack, _arenaSlack = 0.25, 0.4 # share of a step's bytes the allocator may hold beyond them, see estimateMemory.
+_convs = threading.local() # compiled convolutions of each thread.
 
 
 def epsilonDecay(eps, phi, satr, itr, intvl):
@@ -127,14 +72,18 @@ def fastConv2d(data, kernel, convtype='valid', stride=(1, 1)):
 	--------
 		A N x k x m x n array representing the output.
 	"""
-	_data, _kernel =  np.asarray(data, dtype='float32'), np.asarray(kernel, dtype='float32')
-	d = tn.ftensor4('d')
-	k = tn.ftensor4('k')
-	f = thn.function([], conv.conv2d(d, k, None, None, convtype, stride), givens={d: shared(_data), k: shared(_kernel)})
-	return f()
+	# compile each convolution once per thread; a graph per call lingers in reference cycles.
+	convs = _convs.__dict__.setdefault('funcs', {})
+	key = (convtype, tuple(stride))
+	if key not in convs:
+		d = tn.ftensor4('d')
+		k = tn.ftensor4('k')
+		convs[key] = thn.function([d, k], conv.conv2d(d, k, None, None, convtype, stride))
+
+	return convs[key](np.asarray(data, dtype='float32'), np.asarray(kernel, dtype='float32'))
 
 
-def strideUpsample(data, stride):
+def strideUpsample(data, stride, dtype=None):
 	"""
 	Stride image for convolutional upsampling.
 
@@ -142,17 +91,18 @@ def strideUpsample(data, stride):
 	-----
 		data: An N x k x m x n array of images.
 		stride: Tuple repr. stride.
+		dtype: Data type of the result, defaults to that of data.
 
 	Returns:
 	--------
-		An N x k x ((m x stride) - 1) x ((n x stride) - 1) array.
+		An N x k x ((m - 1) x stride + 1) x ((n - 1) x stride + 1) array.
 	"""
-	kernel = np.zeros(stride)
-	kernel[0, 0] = 1
+	if stride[0] == stride[1] == 1:
+		return np.asarray(data, dtype)
 
-	result = np.kron(data, kernel)
-	if stride[0] > 1: # clip last row & column of images
-		result = result[:, :, :-(stride[0] - 1), :-(stride[1] - 1)]
+	N, k, m, n = data.shape
+	result = np.zeros((N, k, (m - 1) * stride[0] + 1, (n - 1) * stride[1] + 1), dtype=dtype or data.dtype)
+	result[:, :, ::stride[0], ::stride[1]] = data
 
 	return result
 
@@ -183,7 +133,7 @@ def rot2d90(data, no_rots):
 
 def maxpool(data, factor, getPos=True):
 	"""
-	Return max pooled data and the pooled pixel positions.
+	Return max pooled data and the position of the max in each pooling window.
 
 	Args:
 	-----
@@ -192,22 +142,120 @@ def maxpool(data, factor, getPos=True):
 
 	Returns:
 	--------
-		An N x k x (m/factor) x (n/factor), N x k x m x n arrays.
+		An N x k x (m/factor) x (n/factor) array and an array of the same shape
+		holding the flat index of the max within each window.
 	"""
-	_data = np.asarray(data, dtype='float32')
-	x = tn.ftensor4('x')
-	f = thn.function([], max_pool(x, factor, True), givens={x: shared(_data)})
-	g = thn.function([], max_pool_same(x, factor)/x, givens={x: shared(_data + 0.0000000001)})
+	N, k, m, n = data.shape
+	p, q = m / factor[0], n / factor[1]
+
+	windows = data[:, :, :p * factor[0], :q * factor[1]].reshape(N, k, p, factor[0], q, factor[1])
+	windows = np.transpose(windows, (0, 1, 2, 4, 3, 5)).reshape(N, k, p, q, factor[0] * factor[1])
 
-	pooled = f()
+	pooled = np.max(windows, axis=4)
 	if not getPos:
 		return pooled
 
-	positions = g()
-	positions[np.where(np.isnan(positions))] = 0
+	positions = np.argmax(windows, axis=4).astype(np.min_scalar_type(factor[0] * factor[1] - 1))
 	return pooled, positions
 
 
+def maxunpool(dEdo, positions, factor):
+	"""
+	Route the errors of max pooled data back to the position of the max in
+	each pooling window. All other positions get zero error.
+
+	Args:
+	-----
+		dEdo: An N x k x m x n array of errors.
+		positions: An N x k x m x n array of flat indices into each window, as
+			returned by maxpool.
+		factor: Pooling factor.
+
+	Returns:
+	--------
+		An N x k x (m x factor) x (n x factor) array of errors.
+	"""
+	N, k, m, n = dEdo.shape
+	rows, cols = np.divmod(positions.astype(np.intp), factor[1])
+
+	# index into a N.k.m x factor x n x factor view of the output.
+	idx = np.arange(N * k * m).reshape(N, k, m, 1) * factor[0] + rows
+	idx = (idx * n + np.arange(n)) * factor[1] + cols
+
+	dE = np.zeros((N, k, m * factor[0], n * factor[1]), dtype=dEdo.dtype)
+	np.put(dE, idx, dEdo)
+	return dE
+
+
+def setThreads(threads):
+	"""
+	Set the no. worker threads used to run layer ops over shards of a batch.
+
+	Args:
+	-----
+		threads: Integer repr. no. worker threads. 1 runs ops on the calling thread.
+	"""
+	global _pool, _threads
+
+	if _pool is not None:
+		_pool.close()
+		_pool.join()
+
+	_pool, _threads = None, max(1, threads)
+	if _threads > 1:
+		_pool = ThreadPool(_threads)
+
+
+def shardMap(func, *arrays):
+	"""
+	Split the given arrays along the batch dimension and apply func to each
+	shard on the worker threads. NumPy releases the GIL in its inner loops, so
+	shards run concurrently.
+
+	Args:
+	-----
+		func: Function taking one shard of each array as its arguments.
+		arrays: N x ... arrays sharing the same batch dimension N.
+
+	Returns:
+	--------
+		The shard results concatenated along the batch dimension. If func
+		returns a tuple, a tuple of concatenated arrays.
+	"""
+	N = arrays[0].shape[0]
+	if _pool is None or N < 2:
+		return func(*arrays)
+
+	bounds = np.linspace(0, N, min(_threads, N) + 1).astype(int)
+	shards = [[a[i:j] for a in arrays] for i, j in zip(bounds[:-1], bounds[1:])]
+	results = _pool.map(lambda shard: func(*shard), shards)
+
+	if isinstance(results[0], tuple):
+		return tuple(np.concatenate(r) for r in zip(*results))
+
+	return np.concatenate(results)
+
+
+def shardApply(func, *arrays):
+	"""
+	Split the given arrays along the batch dimension and apply func to each
+	shard on the worker threads, for funcs that write their results in place.
+
+	Args:
+	-----
+		func: Function taking one shard of each array as its arguments.
+		arrays: N x ... arrays sharing the same batch dimension N.
+	"""
+	N = arrays[0].shape[0]
+	if _pool is None or N < 2:
+		func(*arrays)
+		return
+
+	bounds = np.linspace(0, N, min(_threads, N) + 1).astype(int)
+	shards = [[a[i:j] for a in arrays] for i, j in zip(bounds[:-1], bounds[1:])]
+	_pool.map(lambda shard: func(*shard), shards)
+
+
 def addNoise(data, p=0.5):
 	"""
 	Add noise to the input by randomly setting a pixel to 0.
@@ -257,12 +305,12 @@ class PoolLayer():
 			A N x k x x m1 x m1 array of errors.
 		"""
 		if self.decode:
-			dE = downsample(dEdo, (1, 1, self.factor[0], self.factor[1])) * np.sum(self.factor)
+			dE = shardMap(lambda e: downsample(e, (1, 1, self.factor[0], self.factor[1])) * np.sum(self.factor), dEdo)
 		else:
 			if self.type == 'max':
-				dE = np.kron(dEdo, np.ones(self.factor)) * self.positions
+				dE = shardMap(lambda e, pos: maxunpool(e, pos, self.factor), dEdo, self.positions)
 			else:
-				dE = np.kron(dEdo, np.ones(self.factor)) * (1.0 / np.sum(self.factor))
+				dE = shardMap(lambda e: np.kron(e, np.ones(self.factor, e.dtype)) * (1.0 / np.sum(self.factor)), dEdo)
 
 		return dE
 			
@@ -281,13 +329,76 @@ class PoolLayer():
 		pass #Nothing to do here :P
 
 
-	def feedf(self, data):
+	def release(self):
+		"""
+		Drop the state kept for backprop.
+		"""
+		self.positions = None
+
+
+	def memory(self, shape, itemsize, storeSize=None, errsize=8):
+		"""
+		Count the bytes per image of the arrays this layer allocates in a
+		training step. The stored bytes are exact; the temporaries are
+		counted from the ops in feedf & bprop and must be updated with them.
+
+		Args:
+		-----
+			shape: Tuple repr. the shape of one input image i.e l x m1 x n1.
+			itemsize: Integer repr. bytes per element of the input.
+			storeSize: Unused, pooling layers keep no activations.
+			errsize: Integer repr. bytes per element of the errors backpropagated
+				into the layer, which keep their type through pooling.
+
+		Returns:
+		--------
+			The shape and bytes per element of one output image, and a dictionary
+			of the bytes 'stored' for backprop, the temporaries live at the peak
+			of 'feedf' and 'bprop' and whether the layer keeps its input and
+			output arrays for backprop ('keeps_input', 'keeps_output').
+		"""
+		l, m, n = shape
+		f0, f1 = self.factor
+		intp = np.dtype(np.intp).itemsize
+		sizes = {'keeps_input': False, 'keeps_output': False, 'stored': 0, 'input_copy': 0}
+
+		if self.decode:
+			# kron concatenates into a copy of its output, which avg scales into another.
+			out, outsize = (l, m * f0, n * f1), itemsize
+			sizes['feedf'] = outsize * np.prod(out)
+			# downsample pads the errors into a copy that peaks at twice their size, the means are smaller.
+			sizes['bprop'] = 2 * errsize * np.prod(out)
+		elif self.type == 'max':
+			out, outsize = (l, m / f0, n / f1), itemsize
+			P, X = np.prod(out), l * m * n
+			sizes['stored'] = np.dtype(np.min_scalar_type(f0 * f1 - 1)).itemsize * P
+			sizes['feedf'] = itemsize * f0 * f1 * P + intp * P # the windows copy & the argmax.
+			# the intp positions, rows & cols, two index temporaries and the new idx, then the zeroed errors.
+			sizes['bprop'] = max(5 * intp * P, 3 * intp * P + errsize * X) + intp * P / out[2] # + the row aranges.
+		else:
+			out, outsize = (l, -(-m / f0), -(-n / f1)), itemsize
+			X = np.prod(out) * f0 * f1
+			# downsample pads the input into a copy that peaks at twice its size, three times if it pads.
+			sizes['feedf'] = (2 if X == l * m * n else 3) * itemsize * X
+			sizes['bprop'] = 2 * errsize * X # kron's copy & its scaled product.
+
+		if _pool is not None:
+			# the shard results are concatenated into a copy, the shard temporaries are gone by then.
+			result = outsize * np.prod(out) + sizes['stored']
+			sizes['feedf'] = max(sizes['feedf'], result)
+			sizes['bprop'] = max(sizes['bprop'], 2 * errsize * l * m * n)
+
+		return out, outsize, sizes
+
+
+	def feedf(self, data, train=True):
 		"""
 		Pool features within a given receptive from the input data.
 
 		Args:
 		-----
 			data: An N x k x m1 x n1 array of input plains.
+			train: Boolean indicating if the pooled positions should be kept for backprop.
 
 		Returns:
 		-------
@@ -295,14 +406,16 @@ class PoolLayer():
 		"""
 		if self.decode:
 			if self.type == 'max':
-				pooled = np.kron(data, np.ones(self.factor))
+				pooled = shardMap(lambda d: np.kron(d, np.ones(self.factor, d.dtype)), data)
 			else:
-				pooled = np.kron(data, np.ones(self.factor)) * (1.0 / np.sum(self.factor))
+				pooled = shardMap(lambda d: np.kron(d, np.ones(self.factor, d.dtype)) * (1.0 / np.sum(self.factor)), data)
 		else:
-			if self.type == 'max':
-				pooled, self.positions = maxpool(data, self.factor)
+			if self.type == 'max' and train:
+				pooled, self.positions = shardMap(lambda d: maxpool(d, self.factor), data)
+			elif self.type == 'max':
+				pooled = shardMap(lambda d: maxpool(d, self.factor, False), data)
 			else:
-				pooled = downsample(data, (1, 1, self.factor[0], self.factor[1]))
+				pooled = shardMap(lambda d: downsample(d, (1, 1, self.factor[0], self.factor[1])), data)
 
 		return pooled
 
@@ -312,6 +425,8 @@ class ConvLayer():
 	Convolutional layer class.
 	"""
 
+	storeType = None # dtype the input & activations are kept in for backprop, None keeps them as computed.
+
 	def __init__(self, noKernels, channels, kernelSize, outputType='relu', stride=1, init_w=0.01, init_b=0, decode=False):
 		"""
 		Initialize convolutional layer.
@@ -349,15 +464,8 @@ class ConvLayer():
 		-------
 			A N x l x m1 x n1 array of errors.
 		"""
-		if self.o_type == 'sigmoid':
-			theta = sigmoid(self.maps + self.bias)
-			dEds = dEdo * theta * (1 - theta)
-		elif self.o_type == 'tanh':
-			dEds = dEdo * sech2(self.maps + self.bias)
-		elif self.o_type == 'relu':
-			dEds = dEdo * np.where((self.maps + self.bias) > 0, 1, 0)
-		else:
-			dEds = dEdo
+		dEds = np.empty_like(dEdo)
+		shardApply(self.deriv, dEdo, self.y, dEds)
 
 		if not self.decode:
 			dEds = strideUpsample(dEds, self.stride)
@@ -408,7 +516,64 @@ class ConvLayer():
 		self.bias = self.bias + self.v_b
 
 
-	def feedf(self, data):
+	def release(self):
+		"""
+		Drop the state kept for backprop.
+		"""
+		self.x, self.y = None, None
+
+
+	def memory(self, shape, itemsize, storeSize=None, errsize=8):
+		"""
+		Count the bytes per image of the arrays this layer allocates in a
+		training step. The stored bytes are exact; the temporaries are
+		counted from the ops in feedf & bprop and must be updated with them.
+
+		Args:
+		-----
+			shape: Tuple repr. the shape of one input image i.e l x m1 x n1.
+			itemsize: Integer repr. bytes per element of the input.
+			storeSize: Integer repr. bytes per element of storeType, None if
+				the input & activations are kept as computed.
+			errsize: Integer repr. bytes per element of the errors backpropagated
+				into the layer.
+
+		Returns:
+		--------
+			The shape and bytes per element of one output image, and a dictionary
+			of the bytes 'stored' for backprop, the temporaries live at the peak
+			of 'feedf' and 'bprop' and whether the layer keeps its input and
+			output arrays for backprop ('keeps_input', 'keeps_output').
+		"""
+		l, m, n = shape
+		k, c, h, w = self.kernels.shape
+		s = self.stride[0]
+		X, f32 = l * m * n, np.dtype('float32').itemsize # Theano convolves in float32.
+		sizes = {'keeps_input': False, 'keeps_output': storeSize is None}
+
+		if self.decode:
+			# x is upsampled into storeType (float32 if None), which is the input itself at stride 1 if of that type.
+			out = (k, (m - 1) * s + h, (n - 1) * s + w)
+			Y, U, xsize = np.prod(out), l * ((m - 1) * s + 1) * ((n - 1) * s + 1), storeSize or f32
+			sizes['keeps_input'] = s == 1 and itemsize == xsize
+			sizes['stored'] = (0 if sizes['keeps_input'] else xsize * U) + (storeSize * Y if storeSize else 0)
+			sizes['input_copy'] = 0
+			sizes['feedf'] = f32 * U if xsize != f32 else 0 # the float32 cast for the convolution.
+			sizes['bprop'] = (errsize + f32) * Y + (xsize + f32) * U # errors, rotated x & their float32 casts.
+		else:
+			# errors are upsampled, rotated & cast to float32, as is x if it is not (each copied once more by Theano).
+			out = (k, (m - h) / s + 1, (n - w) / s + 1)
+			Y, U = np.prod(out), np.prod(out) * s * s
+			sizes['keeps_input'] = storeSize is None
+			sizes['stored'] = storeSize * (X + Y) if storeSize else 0
+			sizes['input_copy'] = storeSize * X if storeSize else 0 # not made if handed the array kept below.
+			sizes['feedf'] = f32 * X if itemsize != f32 else 0
+			sizes['bprop'] = (2 * errsize + f32) * U + (2 * f32 * X if storeSize or itemsize != f32 else 0)
+
+		return out, f32, sizes
+
+
+	def feedf(self, data, train=True, stored=None):
 		"""
 		Return the non-linear result of convolving the input data with the
 		weights in this layer.
@@ -416,26 +581,54 @@ class ConvLayer():
 		Args:
 		-----
 			data: An N x l x m1 x n1 array of input plains.
+			train: Boolean indicating if the input and activations should be kept for backprop.
+			stored: Optional array holding data that is kept alive anyway, e.g the
+				activations kept by the layer below, kept as the input of an
+				encoding layer instead of a new copy.
 
 		Returns:
 		-------
 			A N x k x m2 x n2 array of output plains.
 		"""
 		if self.decode:
-			self.x = strideUpsample(data, self.stride)
-			self.maps = fastConv2d(self.x, self.kernels, 'full')
+			x = strideUpsample(data, self.stride, self.storeType or 'float32') # built as kept, not cast from a copy.
+			maps = fastConv2d(x, self.kernels, 'full')
 		else:
-			self.x = data	
-			self.maps = fastConv2d(self.x, self.kernels, stride=self.stride)
+			x = data
+			maps = fastConv2d(x, self.kernels, stride=self.stride)
+
+		shardApply(self.activate, maps)
+		if train:
+			self.x = stored if stored is not None and not self.decode else np.asarray(x, self.storeType)
+			self.y = np.asarray(maps, self.storeType)
+
+		return maps
 
-		if self.o_type == 'tanh':
-			return np.tanh(self.maps + self.bias)
-		elif self.o_type == 'sigmoid':
-			return sigmoid(self.maps + self.bias)
-		elif self.o_type == 'linear':
-			return self.maps + self.bias
 
-		return relu(self.maps + self.bias)
+	def activate(self, maps):
+		"""
+		Add the biases to the given feature maps and apply the non-linearity
+		in place.
+
+		Args:
+		-----
+			maps: A N x k x m2 x n2 array of feature maps.
+		"""
+		maps += self.bias
+		ACTIVATIONS[self.o_type][0](maps, maps)
+
+
+	def deriv(self, dEdo, y, dEds):
+		"""
+		Backpropagate the given errors through the non-linearity.
+
+		Args:
+		-----
+			dEdo: A N x k x m2 x n2 array of errors from prev layers.
+			y: The N x k x m2 x n2 array of activations the errors apply to.
+			dEds: A N x k x m2 x n2 array to write the errors to.
+		"""
+		ACTIVATIONS[self.o_type][1](y, dEdo, dEds)
 
 
 class ConvAE():
@@ -443,12 +636,20 @@ class ConvAE():
 	Convolutional Autoencoder class.
 	"""
 
-	def __init__(self):
+	def __init__(self, threads=None):
 		"""
 		Initialize autoencoder.
+
+		Args:
+		-----
+			threads: Integer repr. no. worker threads to shard each batch over
+				in the pooling, activation and downsampling ops. The worker pool
+				is shared by all networks, so it is only changed if given.
 		"""
 
-		self.layers = []
+		self.layers, self.checkpoints, self.itrs = [], {}, 0
+		if threads is not None:
+			setThreads(threads)
 
 
 	def reflect(self, layer):
@@ -525,71 +726,404 @@ class ConvAE():
   		print "Training complete."
 
 
-  	def train(self, data, test, params, no, prev_layers=[]):
-  		"""
-  		Train the given layers on the given data using the provided
-  		hyperparams.
+	def train(self, data, test, params, no, prev_layers=[], itrs=0, resume_from=None):
+		"""
+		Train the given layers on the given data using the provided
+		hyperparams.
 
-  		Args:
-  		----
-  			data : A no_imgs x img_length x img_width x no_channels array of images.
+		Args:
+		----
+			data : A no_imgs x img_length x img_width x no_channels array of images.
 			test : A no_imgs x img_length x img_width x no_channels array of images.
 			params: A list of training hyperparameters for each layer.
 			no: Tuple indicating start and stop indices of images to display.
 			prev_layers: A list of decoding and encoding convolutional/pooling layers.
-		"""			
-		N, itrs, errors = data.shape[0], 0, []
-			
-		for epoch in xrange(params['epochs']):
+			itrs: Integer repr. no. iterations already trained, for the learning rate schedule.
+			resume_from: String repr. name of a snapshot file to resume training from.
 
-			avg_errors, start, stop = [], range(0, N, params['batch_size']), range(params['batch_size'], N, params['batch_size'])
-			for i, j in zip(start, stop):
- 
-				corrupt_train = addNoise(data[i:j], params['pert_prob'])
-				error = self.feedf(self.layers, corrupt_train) - data[i:j] #euclidean dist.
-				self.backprop(error)
-				self.update(params, itrs)
+		Returns:
+		-------
+			The average reconstruction error on the test images.
+		"""
+		valid_intvl = params.get('valid_intvl', 0)
+		if valid_intvl:
+			n = max(1, int(data.shape[0] * params.get('valid_split', 0.1)))
+			assert n < data.shape[0], "no images left to train on after the validation split"
+			data, valid = data[:-n], data[-n:]
+			best_error, best_params, strikes = float('inf'), self.getParams(), 0
+
+		mixed = params.get('mixed_precision', False)
+		scale, good = float(params.get('loss_scale', 2 ** 10)), 0
+
+		spacing = self.checkpointSpacing(params)
+
+		batch_size, micro, budget = params['batch_size'], params['batch_size'], params.get('mem_budget')
+		if budget:
+			fits = self.maxBatch(data.shape[1:], budget, params)
+			assert fits > 0, "not even one image fits in a memory budget of " + str(budget) + " bytes"
+			batch_size = fits if batch_size == 'auto' else batch_size
+			micro = min(batch_size, fits)
+			print "Batch size: {:d} in micro-batches of {:d}, estimated peak memory: {:d} bytes.".format(batch_size, micro, int(self.estimateMemory(data.shape[1:], micro, params)['peak']))
+		assert batch_size != 'auto', "an 'auto' batch_size needs a mem_budget"
+
+		N, errors, avg_errors, start, begin = data.shape[0], [], [], 0, 0
+
+		if resume_from is not None:
+			saved = loadState(resume_from)
+			self.layers, start, begin, itrs = saved['layers'], saved['epoch'], saved['batch'], saved['itrs']
+			errors, avg_errors, scale, good = saved['errors'], saved['avg_errors'], saved['scale'], saved['good']
+			if valid_intvl:
+				best_error, best_params, strikes = saved['early']
+			np.random.set_state(saved['random'])
+			print "Resuming from epoch {:d}, iteration {:d}...".format(start, itrs)
+
+		for layer in self.layers:
+			if isinstance(layer, ConvLayer):
+				layer.storeType = 'float16' if mixed else None
+
+		def state(epoch, batch): # everything needed to resume at this point.
+			return {
+				'layers': self.snapshot(), 'epoch': epoch, 'batch': batch, 'itrs': itrs,
+				'errors': list(errors), 'avg_errors': list(avg_errors), 'scale': scale, 'good': good,
+				'early': (best_error, best_params, strikes) if valid_intvl else None,
+				'random': np.random.get_state()
+			}
+
+		saver = StateWriter(params['save_file']) if params.get('save_file') else None
+
+		for epoch in xrange(start, params['epochs']):
+
+			for i in xrange(begin, N, batch_size):
+
+				batch = data[i:i + batch_size]
+				avg_error = self.accumulate(batch, params, micro, spacing, scale if mixed else 1)
+				if not mixed:
+					self.update(params, itrs)
+				elif self.unscale(scale):
+					self.update(params, itrs)
+					good = good + 1
+					if good == params.get('scale_window', 100):
+						scale, good = min(scale * 2, params.get('max_loss_scale', 2 ** 16)), 0
+				else:
+					scale, good = scale / 2, 0
+					print '\r| Epoch: {:5d}  |  Iteration: {:8d}  |  Gradient overflow, skipping step. Loss scale: {:g} |'.format(epoch, itrs, scale)
 
-				avg_error = np.average(np.absolute(error)) #TODO: Investigate why error is low.
 				print '\r| Epoch: {:5d}  |  Iteration: {:8d}  |  Avg Reconstruction Error: {:.2f} |'.format(epoch, itrs, avg_error)
 				if epoch != 0 and epoch % 100 == 0:
 					print '---------------------------------------------------------------------------'
 				itrs = itrs + 1
 				avg_errors.append(avg_error)
 
-			i = start[-1]
-			corrupt_train = addNoise(data[i:], params['pert_prob'])
-			error = self.feedf(self.layers, corrupt_train) - data[i:]
+				if saver is not None and itrs % params.get('save_intvl', 100) == 0:
+					saver.save(state(epoch, i + batch_size))
+
+			# plotting sturvs
+			errors.append(np.average(avg_errors))
+			avg_errors, begin = [], 0
+			if params.get('view_errors', True):
+				plt.figure(2)
+				plt.show()
+				plt.xlabel('Epochs')
+				plt.ylabel('Reconstruction Error')
+				plt.plot(range(epoch + 1), errors, '-g')
+				plt.axis([0, params['epochs'], 0, 255])
+				plt.draw()
+			if params['view_kernels']:
+				self.displayKernels()
+			if params['view_recon']:
+				imgs, idx = data[no[0] : no[1]], len(prev_layers) / 2
+				recon = self.feedf(prev_layers[:idx] + self.layers + prev_layers[idx:], imgs, False) #viewing pleasure
+				self.display(recon, 3)
+				self.display(imgs, 4)
+
+			if valid_intvl and (epoch + 1) % valid_intvl == 0:
+				valid_error = self.evaluate(self.layers, valid, micro)
+				print '\r| Epoch: {:5d}  |  Validation Reconstruction Error: {:.4f} |'.format(epoch, valid_error)
+				if valid_error < best_error - params.get('min_delta', 0):
+					best_error, best_params, strikes = valid_error, self.getParams(), 0
+				else:
+					strikes = strikes + 1
+					if strikes >= params.get('patience', 1):
+						print '\rNo improvement in {:d} validations, stopping early.'.format(strikes)
+						break
+
+		if saver is not None:
+			saver.close()
+
+		if valid_intvl:
+			self.setParams(best_params)
+
+		self.itrs = itrs
+		test_error = self.evaluate(self.layers, test, micro)
+		print '\rAverage Reconstruction Error on test images: ', test_error
+		return test_error
+
+
+	def evaluate(self, layers, imgs, batch_size):
+		"""
+		Find the average reconstruction error of the given layers on imgs,
+		feeding them through in batches without keeping any training state.
+
+		Args:
+		-----
+			layers: A set of layers arranged hierarchically.
+			imgs: A no_imgs x img_length x img_width x img_channels array.
+			batch_size: Integer repr. no. images fed through at once.
+
+		Returns:
+		--------
+			The average absolute reconstruction error.
+		"""
+		total = 0.0
+		for i in xrange(0, imgs.shape[0], batch_size):
+			batch = imgs[i:i + batch_size]
+			total = total + np.sum(np.absolute(self.feedf(layers, batch, False) - batch))
+
+		return total / imgs.size
+
+
+	def accumulate(self, batch, params, micro, spacing=0, scale=1):
+		"""
+		Find the error gradients of the network on a batch of noisy images,
+		feeding them through in micro-batches of at most micro images and
+		summing the gradients of each weighted by its share of the batch.
+
+		Args:
+		-----
+			batch: A no_imgs x img_length x img_width x img_channels array.
+			params: Training parameters.
+			micro: Integer repr. max no. images fed through at once.
+			spacing: Integer repr. no. layers between activation checkpoints.
+			scale: Float repr. the factor the errors are scaled by before backprop.
+
+		Returns:
+		--------
+			The average absolute reconstruction error on the batch.
+		"""
+		layers = [layer for layer in self.layers if isinstance(layer, ConvLayer)]
+		total, grads = 0.0, None
+
+		for j in xrange(0, batch.shape[0], micro):
+			imgs = batch[j:j + micro]
+			corrupt_train = addNoise(imgs, params['pert_prob'])
+			error = self.feedf(self.layers, corrupt_train, spacing=spacing) - imgs #euclidean dist.
+			total = total + np.sum(np.absolute(error)) #TODO: Investigate why error is low.
+			if scale != 1: # loss scaled errors are backpropagated in float32, as the convolutions run.
+				error = np.multiply(error, scale, dtype='float32')
 			self.backprop(error)
-			self.update(params, itrs)
-
-			avg_error = np.average(np.absolute(error))
-			print '\r| Epoch: {:5d}  |  Iteration: {:8d}  |  Avg Reconstruction Error: {:.2f} |'.format(epoch, itrs, avg_error)
-			if epoch != 0 and epoch % 100 == 0:
-				print '----------------------------------------------------------------------------'
-			itrs = itrs + 1
-			avg_errors.append(avg_error)
-
-  			# plotting sturvs
-  			plt.figure(2)
-  			plt.show()
-  			errors.append(np.average(avg_errors))
-  			plt.xlabel('Epochs')
-  			plt.ylabel('Reconstruction Error')
-  			plt.plot(range(epoch + 1), errors, '-g')
-  			plt.axis([0, params['epochs'], 0, 255])
-  			plt.draw()
-  			if params['view_kernels']:
-  				self.displayKernels()
-  			if params['view_recon']:
-  				imgs, idx = data[no[0] : no[1]], len(prev_layers) / 2
-  				recon = self.feedf(prev_layers[:idx] + self.layers + prev_layers[idx:], imgs) #viewing pleasure
-  				self.display(recon, 3)
-  				self.display(imgs, 4)
-
-		recon = self.feedf(self.layers, test)
-		print '\rAverage Reconstruction Error on test images: ', np.average(np.absolute(recon - test))
-			
+
+			if imgs.shape[0] < batch.shape[0]:
+				share = imgs.shape[0] / float(batch.shape[0])
+				if grads is None:
+					grads = [(layer.dEdw * share, layer.dEdb * share) for layer in layers]
+				else:
+					grads = [(w + layer.dEdw * share, b + layer.dEdb * share) for layer, (w, b) in zip(layers, grads)]
+
+		if grads is not None:
+			for layer, (w, b) in zip(layers, grads):
+				layer.dEdw, layer.dEdb = w, b
+
+		return total / batch.size
+
+
+	def checkpointSpacing(self, params):
+		"""
+		Find the no. layers between activation checkpoints set by the training params.
+
+		Args:
+		-----
+			params: Training parameters.
+
+		Returns:
+		--------
+			The spacing, 0 if checkpointing is off.
+		"""
+		spacing = params.get('checkpoint', 0)
+		if spacing == 'sqrt':
+			spacing = int(np.ceil(np.sqrt(len(self.layers))))
+
+		return spacing
+
+
+	def estimateMemory(self, shape, batch_size, params={}):
+		"""
+		Estimate the peak memory of a training step of the network by walking
+		its layers, decoders included. The bytes each layer keeps for backprop
+		are exact (tests.py checks them against the arrays kept). The
+		temporaries of feedf & bprop are counted from the current ops, the
+		live bytes of measured steps have come within 0-20% under the count.
+		Freed blocks the allocator holds on to for reuse add up to ~20% more,
+		and the separate arena of the worker threads another ~40%, so the
+		count is raised by _heapSlack, and _arenaSlack with worker threads.
+		The training data and the Python/Theano runtime are not counted.
+
+		Args:
+		-----
+			shape: Tuple repr. the shape of one image i.e img_length x img_width x img_channels.
+			batch_size: Integer repr. no. images in a (micro) batch.
+			params: A dictionary of training parameters; mixed_precision &
+				checkpoint are taken into account.
+
+		Returns:
+		--------
+			A dictionary holding the peak bytes of the step ('peak'), the bytes
+			that do not grow with the batch ('fixed') and those added by each
+			image ('per_image'), and for each layer the bytes per image it keeps
+			for backprop ('stored').
+		"""
+		m, n, c = shape
+		L, img = len(self.layers), m * n * c
+		storeSize = 2 if params.get('mixed_precision', False) else None
+		spacing = self.checkpointSpacing(params)
+
+		# errors are float64 until a convolution (or the loss scaling) makes them float32.
+		errsizes, errsize = [], 4 if storeSize else 8
+		for layer in self.layers:
+			errsizes.append(errsize)
+			errsize = 4 if isinstance(layer, ConvLayer) else errsize
+
+		# walk the layers in feedf order collecting the arrays of each.
+		info, shp, itemsize = [None] * L, (c, m, n), 8
+		for i in xrange(L - 1, -1, -1):
+			out, outsize, sizes = self.layers[i].memory(shp, itemsize, storeSize, errsizes[i])
+			if i == L - 1 or isinstance(self.layers[i + 1], ConvLayer): # see feedLayer.
+				sizes['stored'] = sizes['stored'] - sizes['input_copy']
+			sizes['input'], sizes['output'], sizes['error'] = itemsize * np.prod(shp), outsize * np.prod(out), errsizes[i] * np.prod(out)
+			info[i], shp, itemsize = sizes, out, outsize
+
+		# a layer's output outlives its feedf if it or the next layer keeps it for backprop.
+		kept_out = [info[i]['keeps_output'] or (i > 0 and info[i - 1]['keeps_input']) for i in xrange(L)]
+		held = [info[i]['stored'] + (info[i]['output'] if kept_out[i] else 0) for i in xrange(L)]
+		fresh_in = lambda i: 0 if i == L - 1 or kept_out[i + 1] else info[i]['input']
+		feedf = lambda i: fresh_in(i) + info[i]['feedf'] + info[i]['output'] + info[i]['stored']
+
+		# the noisy batch lives through the step, its binomial draws only while it is made.
+		noisy = 8 * img
+		peak, kept = 2 * noisy, 0
+
+		if spacing: # only the checkpointed inputs are kept, each segment is recomputed before its backprop.
+			bounds = [i for i in xrange(L) if (L - 1 - i) % spacing == 0]
+			saved = dict((i, info[i]['input'] if i < L - 1 else 0) for i in bounds)
+		else:
+			bounds, saved = [L - 1], {}
+
+		for i in xrange(L - 1, -1, -1): # a decoder builds its stored x even if it is not kept.
+			peak = max(peak, noisy + kept + feedf(i))
+			kept = kept + (saved.get(i - 1, 0) if spacing else held[i])
+
+		# the float64 error, next to the output it is taken from or its abs; a loss scaled float32 copy replaces it.
+		peak = max(peak, noisy + kept + 8 * img + max(8 * img, 0 if kept_out[0] else info[0]['output']))
+		base = noisy + (4 if storeSize else 8) * img
+		lo = 0
+		for hi in bounds:
+			if spacing: # the errors into the segment live through its recompute.
+				kept, error = 0, info[lo]['error'] if lo > 0 else 0
+				for i in xrange(hi, lo - 1, -1):
+					peak = max(peak, base + sum(saved.values()) + error + kept + feedf(i))
+					kept = kept + held[i]
+				# the checkpoint lives on if its layer keeps it, as an encoder does in place of its copy.
+				checkpoint = saved.pop(hi)
+				kept = kept + (checkpoint if info[hi]['keeps_input'] or info[hi]['input_copy'] else 0)
+
+			for i in xrange(lo, hi + 1):
+				error = info[i]['error'] if i > 0 else 0 # the first is a view of the error.
+				peak = max(peak, base + sum(saved.values()) + kept + error + info[i]['bprop'])
+				kept = kept - held[i]
+
+			lo = hi + 1
+
+		# weights, velocities, RMSProp averages, gradients and the update temporaries.
+		fixed = sum(6 * (layer.kernels.nbytes + layer.bias.nbytes) for layer in self.layers if isinstance(layer, ConvLayer))
+		peak = peak * (1 + _heapSlack + (_arenaSlack if _pool is not None else 0))
+
+		return {'peak': fixed + batch_size * peak, 'fixed': fixed, 'per_image': peak, 'stored': held}
+
+
+	def maxBatch(self, shape, budget, params={}):
+		"""
+		Find the largest batch whose training step fits in the given memory budget.
+
+		Args:
+		-----
+			shape: Tuple repr. the shape of one image i.e img_length x img_width x img_channels.
+			budget: Integer repr. no. bytes available for training.
+			params: A dictionary of training parameters, see estimateMemory.
+
+		Returns:
+		--------
+			The no. images, 0 if not even one image fits.
+		"""
+		report = self.estimateMemory(shape, 1, params)
+		return max(0, int((budget - report['fixed']) // report['per_image']))
+
+
+	def unscale(self, scale):
+		"""
+		Divide the loss scale out of the error gradients in the network.
+
+		Args:
+		-----
+			scale: Float repr. the factor the errors were scaled by before backprop.
+
+		Returns:
+		--------
+			False, leaving the gradients untouched, if any gradient overflowed.
+		"""
+		layers = [layer for layer in self.layers if isinstance(layer, ConvLayer)]
+		for layer in layers:
+			if not (np.all(np.isfinite(layer.dEdw)) and np.all(np.isfinite(layer.dEdb))):
+				return False
+
+		for layer in layers:
+			layer.dEdw, layer.dEdb = layer.dEdw / scale, layer.dEdb / scale
+
+		return True
+
+
+	def snapshot(self):
+		"""
+		Get a copy of the layers without the state kept for backprop. Layer
+		updates replace rather than modify the weight and optimizer arrays, so
+		the copies share those arrays with the live layers instead of copying.
+
+		Returns:
+		--------
+			A list of layers.
+		"""
+		layers = []
+		for layer in self.layers:
+			snap = copy(layer)
+			snap.release()
+			snap.__dict__.pop('dEdw', None)
+			snap.__dict__.pop('dEdb', None)
+			layers.append(snap)
+
+		return layers
+
+
+	def getParams(self):
+		"""
+		Get a copy of the kernels and biases in the network.
+
+		Returns:
+		--------
+			A list containing a (kernels, bias) tuple for each convolutional layer.
+		"""
+		return [(layer.kernels.copy(), layer.bias.copy()) for layer in self.layers if isinstance(layer, ConvLayer)]
+
+
+	def setParams(self, params):
+		"""
+		Restore the kernels and biases in the network.
+
+		Args:
+		-----
+			params: A list of (kernels, bias) tuples as returned by getParams.
+		"""
+		layers = [layer for layer in self.layers if isinstance(layer, ConvLayer)]
+		for layer, (kernels, bias) in zip(layers, params):
+			layer.kernels, layer.bias = kernels, bias
+
 
 	def backprop(self, dE):
 		"""
@@ -600,11 +1134,50 @@ class ConvAE():
 			dE: A no_imgs x img_length x img_width x img_channels array.
 		"""
 		error = np.transpose(dE, (0, 3, 1, 2))
-		for layer in self.layers:
-			error = layer.bprop(error)
+		bounds = sorted(self.checkpoints) if self.checkpoints else [len(self.layers) - 1]
 
+		lo = 0
+		for hi in bounds:
 
-	def feedf(self, layers, imgs):
+			if self.checkpoints: # recompute the segment's state from its checkpoint.
+				data = self.checkpoints.pop(hi)
+				stored = data
+				for i in xrange(hi, lo - 1, -1):
+					data, stored = self.feedLayer(self.layers[i], data, True, stored)
+				data = stored = None # the layers keep what their bprop needs.
+
+			for i in xrange(lo, hi + 1):
+				error = self.layers[i].bprop(error)
+				self.layers[i].release()
+
+			lo = hi + 1
+
+
+	def feedLayer(self, layer, data, train, stored):
+		"""
+		Feed data through a layer, letting a convolutional layer keep the array
+		holding data that is already kept for backprop rather than its own copy.
+
+		Args:
+		-----
+			layer: A convolutional/pooling layer.
+			data: An N x l x m1 x n1 array of input plains.
+			train: Boolean indicating if the layer should keep the state needed for backprop.
+			stored: The array kept by the layer below holding data, or None.
+
+		Returns:
+		--------
+			The N x k x m2 x n2 output of the layer and the array the layer kept
+			holding it, or None.
+		"""
+		if isinstance(layer, ConvLayer):
+			data = layer.feedf(data, train, stored)
+			return data, layer.y if train else None
+
+		return layer.feedf(data, train), None
+
+
+	def feedf(self, layers, imgs, train=True, spacing=0):
 		"""
 		Feed the imgs through the given set of layers.
 
@@ -612,6 +1185,10 @@ class ConvAE():
 		----
 			layers: A set of layers arranged hierarchically.
 			imgs: A no_imgs x img_length x img_width x img_channels array.
+			train: Boolean indicating if layers should keep the state needed for backprop.
+			spacing: Integer repr. no. layers between activation checkpoints. If
+				non-zero, only the inputs at the checkpoints are kept when training
+				and backprop recomputes the rest.
 
 		Returns:
 		-------
@@ -619,13 +1196,157 @@ class ConvAE():
 		"""
 
 		data = np.transpose(imgs, (0, 3, 1, 2))
+		stored = data # the input batch is kept alive through the step anyway.
+		if train:
+			self.checkpoints = {}
 
 		for i in xrange(len(layers) - 1, - 1, -1):
-			data = layers[i].feedf(data)
+			if train and spacing and (len(layers) - 1 - i) % spacing == 0:
+				self.checkpoints[i] = data
+			data, stored = self.feedLayer(layers[i], data, train and not spacing, stored)
 
 		return np.transpose(data, (0, 2, 3, 1))
 
 
+	def receptiveField(self, layers):
+		"""
+		Find the receptive field of the output units of the given layers.
+
+		Args:
+		-----
+			layers: A set of layers arranged hierarchically.
+
+		Returns:
+		--------
+			The receptive field size and the stride between output units, both
+			in input pixels, and the total downsampling of the encoding layers.
+		"""
+		size, jump, align = 1.0, 1.0, 1
+		for layer in reversed(layers):
+			if isinstance(layer, ConvLayer) and layer.decode:
+				jump = jump / layer.stride[0]
+				size = size + (layer.kernels.shape[2] - 1) * jump
+			elif isinstance(layer, ConvLayer):
+				size = size + (layer.kernels.shape[2] - 1) * jump
+				jump = jump * layer.stride[0]
+			elif layer.decode:
+				jump = jump / layer.factor[0]
+			else:
+				size = size + (layer.factor[0] - 1) * jump
+				jump = jump * layer.factor[0]
+			align = max(align, int(round(jump)))
+
+		return int(np.ceil(size)), max(1, int(round(jump))), align
+
+
+	def tiledFeedf(self, layers, imgs, tile, overlap=None, batch_size=16, workers=1):
+		"""
+		Feed large imgs through the given set of layers as overlapping tiles,
+		blending the tile outputs back together. Only batch_size tiles (per
+		worker) are in flight at once, so memory does not grow with image size.
+		The output has the shape feedf would give. If the image sides are not
+		a multiple of the alignment (see receptiveField), the last tiles are
+		padded by repeating the edge pixels, so outputs within the receptive
+		field of the far edges differ slightly from feedf's.
+
+		Args:
+		-----
+			layers: A set of layers arranged hierarchically e.g all the layers to
+				reconstruct or the encoding half to encode.
+			imgs: A no_imgs x img_length x img_width x img_channels array.
+			tile: Integer repr. the side of each square tile, a size the layers accept.
+			overlap: Integer repr. overlap between tiles. Defaults to the receptive field.
+			batch_size: Integer repr. no. tiles fed through at once.
+			workers: Integer repr. no. threads feeding batches of tiles through.
+
+		Returns:
+		-------
+			A no_imgs x out_length x out_width x out_channels array.
+		"""
+		N, m, n, c = imgs.shape
+		size, stride, align = self.receptiveField(layers)
+
+		# outputs within margin of a tile edge are missing codes from beyond the tile.
+		margin = 0
+		for layer in reversed(layers):
+			if isinstance(layer, ConvLayer) and layer.decode:
+				margin = margin * layer.stride[0] + layer.kernels.shape[2] - 1
+			elif isinstance(layer, PoolLayer) and layer.decode:
+				margin = margin * layer.factor[0]
+
+		overlap = max(size, 2 * margin) if overlap is None else overlap
+		overlap = int(np.ceil(overlap / float(align))) * align
+		step = tile - overlap
+		assert step > 0 and step % align == 0, "tile must exceed the overlap by a multiple of " + str(align)
+		assert overlap >= 2 * margin, "overlap must be at least " + str(2 * margin)
+
+		# step tiles across each image, the last flush with the far edge (padded up to the alignment).
+		starts = lambda d: range(0, d, step) + [d] if d % step else range(0, d + 1, step)
+		rows, cols = [starts(int(np.ceil(max(d - tile, 0) / float(align))) * align) for d in (m, n)]
+		offsets = [(r, q) for r in rows for q in cols]
+		mp, np_ = rows[-1] + tile, cols[-1] + tile
+
+		out_tile = self.feedf(layers, np.zeros((1, tile, tile, c)), False).shape
+
+		def window(r, q): # blending weights, tapering off toward the tile edges inside the image.
+			ramps = []
+			for l, first, last in ((out_tile[1], r == 0, r == rows[-1]), (out_tile[2], q == 0, q == cols[-1])):
+				d = np.minimum(np.arange(l) + (l if first else 0), np.arange(l)[::-1] + (l if last else 0))
+				ramps.append(np.clip((d - margin + 1) / (overlap / float(stride) - 2 * margin + 1), 1e-6, 1))
+			return np.outer(ramps[0], ramps[1]).reshape(out_tile[1], out_tile[2], 1)
+
+		out = np.zeros((N, (mp - tile) / stride + out_tile[1], (np_ - tile) / stride + out_tile[2], out_tile[3]), dtype='float32')
+		weights = np.zeros(out.shape[1:3] + (1,), dtype='float32')
+		for r, q in offsets:
+			weights[r / stride : r / stride + out_tile[1], q / stride : q / stride + out_tile[2]] += window(r, q)
+
+		def feedTiles(tiles):
+			batch = np.zeros((len(tiles), tile, tile, c), dtype=imgs.dtype)
+			for t, (i, r, q) in enumerate(tiles):
+				crop = imgs[i, r : r + tile, q : q + tile]
+				batch[t] = np.pad(crop, ((0, tile - crop.shape[0]), (0, tile - crop.shape[1]), (0, 0)), 'edge')
+			return tiles, self.feedf(layers, batch, False)
+
+		tiles = [(i, r, q) for i in xrange(N) for r, q in offsets]
+		batches = [tiles[i : i + batch_size] for i in xrange(0, len(tiles), batch_size)]
+		pool = ThreadPool(workers) if workers > 1 else None
+
+		for i in xrange(0, len(batches), workers):
+			results = pool.map(feedTiles, batches[i : i + workers]) if pool else [feedTiles(batches[i])]
+			for done, recon in results:
+				for (j, r, q), rec in zip(done, recon):
+					out[j, r / stride : r / stride + out_tile[1], q / stride : q / stride + out_tile[2]] += rec * window(r, q)
+
+		if pool:
+			pool.close()
+			pool.join()
+
+		out /= weights
+		p, q, k = self.outputShape(layers, (m, n, c))
+		assert p <= out.shape[1] and q <= out.shape[2], "tile is too small for the layers"
+		return out[:, :p, :q]
+
+
+	def outputShape(self, layers, shape):
+		"""
+		Find the shape of the output of the given layers.
+
+		Args:
+		-----
+			layers: A set of layers arranged hierarchically.
+			shape: Tuple repr. the shape of one image i.e img_length x img_width x img_channels.
+
+		Returns:
+		--------
+			The shape of one output image i.e out_length x out_width x out_channels.
+		"""
+		shp = (shape[2], shape[0], shape[1])
+		for layer in reversed(layers):
+			shp = layer.memory(shp, 8)[0]
+
+		return shp[1], shp[2], shp[0]
+
+
 	def update(self, params, i):
 		"""
 		Update the network weights.
@@ -0,0 +1,206 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import numpy as np
+import cPickle as cpkl
+from numpy.lib.stride_tricks import as_strided
+from activations import ACTIVATIONS
+
+
+def freeze(layers, shape):
+	"""
+	Compile trained layers into a frozen inference plan for inputs of the
+	given shape. Only NumPy and the activation table are needed to run or
+	load the plan.
+
+	Args:
+	-----
+		layers: A set of trained layers arranged hierarchically e.g ConvAE.layers.
+		shape: Tuple repr. the input shape i.e no_imgs x img_length x img_width x img_channels.
+
+	Returns:
+	--------
+		A Plan.
+	"""
+	ops = []
+	for layer in reversed(layers):
+		if hasattr(layer, 'kernels') and layer.decode:
+			# the strided upsample and full convolution is a transposed convolution.
+			k, c, m, n = layer.kernels.shape
+			weights = np.transpose(layer.kernels, (1, 2, 3, 0)).reshape(c, m * n * k)
+			ops.append(('convT', {'weights': weights, 'bias': layer.bias.ravel(), 'size': (m, n),
+									'stride': layer.stride[0], 'act': layer.o_type}))
+		elif hasattr(layer, 'kernels'):
+			# flip the kernels so the convolution becomes a correlation of image patches.
+			k, c, m, n = layer.kernels.shape
+			weights = np.transpose(layer.kernels[:, :, ::-1, ::-1], (2, 3, 1, 0)).reshape(m * n * c, k)
+			ops.append(('conv', {'weights': weights, 'bias': layer.bias.ravel(), 'size': (m, n),
+									'stride': layer.stride[0], 'act': layer.o_type}))
+		elif layer.decode:
+			scale = 1.0 if layer.type == 'max' else 1.0 / np.sum(layer.factor)
+			ops.append(('unpool', {'factor': tuple(layer.factor), 'scale': scale}))
+		else:
+			ops.append((layer.type + 'pool', {'factor': tuple(layer.factor)}))
+
+	for kind, op in ops:
+		for key in ('weights', 'bias'):
+			if key in op:
+				op[key] = np.ascontiguousarray(op[key], dtype='float32')
+
+	return Plan(ops, shape)
+
+
+def loadPlan(filename):
+	"""
+	Load a plan saved in file filename.
+
+	Args:
+	-----
+		filename: String repr. name of file.
+
+	Returns:
+	--------
+		A Plan.
+	"""
+	f = open(filename, 'rb')
+	model = cpkl.load(f)
+	f.close()
+	return Plan(model['ops'], model['shape'])
+
+
+class Plan():
+	"""
+	Frozen inference plan of a convolutional autoencoder.
+	"""
+
+	def __init__(self, ops, shape):
+		"""
+		Initialize the plan, allocating every buffer it runs in.
+
+		Args:
+		-----
+			ops: A list of (kind, params) tuples as built by freeze.
+			shape: Tuple repr. the input shape i.e no_imgs x img_length x img_width x img_channels.
+		"""
+		self.ops, self.shape, self.steps = ops, tuple(shape), []
+
+		N, m, n, c = shape
+		for kind, op in ops:
+			if kind == 'conv':
+				(h, w), s = op['size'], op['stride']
+				m, n = (m - h) / s + 1, (n - w) / s + 1
+				bufs = {'cols': np.empty((N * m * n, h * w * c), dtype='float32')}
+				c = op['weights'].shape[1]
+				bufs['out'] = np.empty((N * m * n, c), dtype='float32')
+			elif kind == 'convT':
+				(h, w), s = op['size'], op['stride']
+				bufs = {'cols': np.empty((N * m * n, op['weights'].shape[1]), dtype='float32')}
+				m, n, c = (m - 1) * s + h, (n - 1) * s + w, op['weights'].shape[1] / (h * w)
+				bufs['out'] = np.empty((N, m, n, c), dtype='float32')
+			elif kind == 'unpool':
+				m, n = m * op['factor'][0], n * op['factor'][1]
+				bufs = {'out': np.empty((N, m, n, c), dtype='float32')}
+			else:
+				f = op['factor']
+				if kind == 'avgpool': # pad with zeros like downscale_local_mean.
+					m, n = -(-m / f[0]), -(-n / f[1])
+					bufs = {'pad': np.zeros((N, m * f[0], n * f[1], c), dtype='float32')}
+				else:
+					m, n = m / f[0], n / f[1]
+					bufs = {}
+				bufs['out'] = np.empty((N, m, n, c), dtype='float32')
+
+			self.steps.append((kind, op, bufs))
+
+		self.outShape = (N, m, n, c)
+
+
+	def run(self, imgs):
+		"""
+		Feed the imgs through the plan.
+
+		Args:
+		-----
+			imgs: An array of the plan's input shape.
+
+		Returns:
+		--------
+			An array of the plan's output shape. It is overwritten by the next run,
+			so copy it to keep it.
+		"""
+		assert imgs.shape == self.shape, "plan was frozen for inputs of shape " + str(self.shape)
+		data = np.asarray(imgs, dtype='float32')
+
+		for kind, op, bufs in self.steps:
+			N, m, n, c = data.shape
+
+			if kind == 'conv':
+				(h, w), s = op['size'], op['stride']
+				p, q = (m - h) / s + 1, (n - w) / s + 1
+				st = data.strides
+				patches = as_strided(data, (N, p, q, h, w, c), (st[0], st[1] * s, st[2] * s, st[1], st[2], st[3]))
+				bufs['cols'].reshape(N, p, q, h, w, c)[...] = patches
+				out = np.dot(bufs['cols'], op['weights'], out=bufs['out'])
+				out += op['bias']
+				ACTIVATIONS[op['act']][0](out, out)
+				data = out.reshape(N, p, q, -1)
+
+			elif kind == 'convT':
+				(h, w), s = op['size'], op['stride']
+				cols = np.dot(data.reshape(N * m * n, c), op['weights'], out=bufs['cols'])
+				cols = cols.reshape(N, m, n, h, w, -1)
+				out = bufs['out']
+				out.fill(0)
+				for a in xrange(h):
+					for b in xrange(w):
+						out[:, a : a + (m - 1) * s + 1 : s, b : b + (n - 1) * s + 1 : s] += cols[:, :, :, a, b]
+				out += op['bias']
+				ACTIVATIONS[op['act']][0](out, out)
+				data = out
+
+			elif kind == 'unpool':
+				f = op['factor']
+				out = bufs['out']
+				out.reshape(N, m, f[0], n, f[1], c)[...] = data.reshape(N, m, 1, n, 1, c)
+				if op['scale'] != 1:
+					out *= op['scale']
+				data = out
+
+			elif kind == 'maxpool':
+				f = op['factor']
+				p, q = m / f[0], n / f[1]
+				blocks = data[:, :p * f[0], :q * f[1]].reshape(N, p, f[0], q, f[1], c)
+				data = np.max(blocks, axis=(2, 4), out=bufs['out'])
+
+			else:
+				f = op['factor']
+				pad = bufs['pad']
+				pad[:, :m, :n] = data
+				p, q = pad.shape[1] / f[0], pad.shape[2] / f[1]
+				data = np.mean(pad.reshape(N, p, f[0], q, f[1], c), axis=(2, 4), out=bufs['out'])
+
+		return data
+
+
+	def save(self, filename):
+		"""
+		Save the plan in file filename.
+
+		Args:
+		-----
+			filename: String repr. name of file.
+		"""
+		f = open(filename, 'wb')
+		cpkl.dump({'ops': self.ops, 'shape': self.shape}, f, cpkl.HIGHEST_PROTOCOL)
+		f.close()
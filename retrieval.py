@@ -0,0 +1,307 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import numpy as np
+import cPickle as cpkl
+
+
+def sqDists(queries, codes):
+	"""
+	Find the squared euclidean distances between queries and codes.
+
+	Args:
+	-----
+		queries: A q x d array.
+		codes: A N x d array.
+
+	Returns:
+	--------
+		A q x N array of distances.
+	"""
+	dists = np.dot(queries, codes.T)
+	dists *= -2
+	dists += np.sum(np.square(codes), axis=1)
+	dists += np.sum(np.square(queries), axis=1).reshape(-1, 1)
+	return dists
+
+
+def topk(dists, k):
+	"""
+	Find the k smallest distances in each row.
+
+	Args:
+	-----
+		dists: A q x N array of distances.
+		k: Integer repr. no. neighbours.
+
+	Returns:
+	--------
+		q x k arrays of column indices and distances sorted by distance.
+	"""
+	k = min(k, dists.shape[1])
+	idx = np.argpartition(dists, k - 1, axis=1)[:, :k]
+	part = dists[np.arange(dists.shape[0]).reshape(-1, 1), idx]
+	order = np.argsort(part, axis=1)
+	rows = np.arange(dists.shape[0]).reshape(-1, 1)
+	return idx[rows, order], part[rows, order]
+
+
+def kmeans(data, k, iters=10):
+	"""
+	Cluster the data with Lloyd's algorithm.
+
+	Args:
+	-----
+		data: A N x d array.
+		k: Integer repr. no. clusters.
+		iters: Integer repr. no. iterations.
+
+	Returns:
+	--------
+		A k x d array of centroids.
+	"""
+	centroids = data[np.random.choice(data.shape[0], k, replace=False)].copy()
+	for i in xrange(iters):
+		assign = np.argmin(sqDists(data, centroids), axis=1)
+		counts = np.bincount(assign, minlength=k)
+		for j in xrange(data.shape[1]):
+			centroids[:, j] = np.bincount(assign, data[:, j], minlength=k) / np.maximum(counts, 1)
+		empty = counts == 0 # reseed empty clusters.
+		centroids[empty] = data[np.random.choice(data.shape[0], np.sum(empty), replace=False)]
+
+	return centroids
+
+
+class CodeIndex():
+	"""
+	Nearest neighbour index over the codes of a trained autoencoder's encoder.
+	"""
+
+	def __init__(self, ae, path, quantize=False, lists=32, probes=4, batch_size=500):
+		"""
+		Initialize the index.
+
+		Args:
+		-----
+			ae: A trained ConvAE.
+			path: String repr. the .npy file the corpus codes are memory-mapped in.
+			quantize: Boolean option to store the codes as int8 with a scale per dimension.
+			lists: Integer repr. no. inverted lists (k-means clusters) in the index.
+			probes: Integer repr. no. lists searched per query.
+			batch_size: Integer repr. no. images encoded or queries searched at once.
+		"""
+		self.ae, self.encoder = ae, ae.layers[len(ae.layers) / 2:]
+		self.path, self.quantize = path, quantize
+		self.no_lists, self.probes, self.batch_size = lists, probes, batch_size
+		self.codes, self.scale = None, None
+
+
+	def encode(self, imgs):
+		"""
+		Encode the given images.
+
+		Args:
+		-----
+			imgs: A no_imgs x img_length x img_width x no_channels array of images.
+
+		Returns:
+		--------
+			A no_imgs x d float32 array of codes.
+		"""
+		codes = self.ae.feedf(self.encoder, imgs, False)
+		return np.asarray(codes.reshape(imgs.shape[0], -1), dtype='float32')
+
+
+	def build(self, imgs, iters=10, sample=10000):
+		"""
+		Encode the corpus into the memory-mapped code matrix and build the
+		inverted lists.
+
+		Args:
+		-----
+			imgs: A no_imgs x img_length x img_width x no_channels array of images.
+			iters: Integer repr. no. k-means iterations.
+			sample: Integer repr. max no. codes the k-means clustering is fitted on.
+		"""
+		N = imgs.shape[0]
+		d = self.encode(imgs[:1]).shape[1]
+
+		# encode the corpus once; int8 codes need the scale over all of it first, so go through a float32 file.
+		codes = np.lib.format.open_memmap(self.path + '.tmp' if self.quantize else self.path, 'w+', 'float32', (N, d))
+		self.scale = np.zeros(d, dtype='float32') if self.quantize else None
+		for i in xrange(0, N, self.batch_size):
+			codes[i:i + self.batch_size] = self.encode(imgs[i:i + self.batch_size])
+			if self.quantize: # scale each dimension by its max magnitude over the corpus.
+				self.scale = np.maximum(self.scale, np.max(np.absolute(codes[i:i + self.batch_size]), axis=0))
+
+		if self.quantize:
+			self.scale = np.maximum(self.scale, 1e-12) / 127
+			self.codes = np.lib.format.open_memmap(self.path, 'w+', 'int8', (N, d))
+			for i in xrange(0, N, self.batch_size):
+				self.codes[i:i + self.batch_size] = np.clip(np.round(codes[i:i + self.batch_size] / self.scale), -127, 127)
+			del codes
+			os.remove(self.path + '.tmp')
+		else:
+			self.codes = codes
+		self.codes.flush()
+
+		idx = np.random.choice(N, min(N, sample), replace=False)
+		self.centroids = kmeans(self.decode(self.codes[np.sort(idx)]), min(self.no_lists, N), iters)
+
+		assign = np.concatenate([np.argmin(sqDists(self.decode(self.codes[i:i + self.batch_size]), self.centroids), axis=1) for i in xrange(0, N, self.batch_size)])
+		self.order = np.argsort(assign, kind='mergesort')
+		self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=self.centroids.shape[0]))))
+
+
+	def decode(self, codes):
+		"""
+		Convert stored codes back to float32.
+
+		Args:
+		-----
+			codes: A N x d array of stored codes.
+
+		Returns:
+		--------
+			A N x d float32 array of codes.
+		"""
+		if self.quantize:
+			return codes.astype('float32') * self.scale
+
+		return np.asarray(codes, dtype='float32')
+
+
+	def query(self, imgs, k=10):
+		"""
+		Find the approximate k nearest corpus images to each query image.
+
+		Args:
+		-----
+			imgs: A no_imgs x img_length x img_width x no_channels array of query images.
+			k: Integer repr. no. neighbours.
+
+		Returns:
+		--------
+			no_imgs x k arrays of corpus indices and squared distances.
+		"""
+		idx, dists = [], []
+		for i in xrange(0, imgs.shape[0], self.batch_size):
+			queries = self.encode(imgs[i:i + self.batch_size])
+			probes, _ = topk(sqDists(queries, self.centroids), self.probes)
+			best_idx = -np.ones((queries.shape[0], k), dtype=int)
+			best = np.inf * np.ones((queries.shape[0], k), dtype='float32')
+
+			# read each probed list once and search it for all the queries probing it.
+			for l in np.unique(probes):
+				cands = self.order[self.offsets[l]:self.offsets[l + 1]] # sorted, so reads are sequential.
+				if len(cands) == 0:
+					continue
+				rows = np.nonzero(np.any(probes == l, axis=1))[0]
+				found, d = topk(sqDists(queries[rows], self.decode(self.codes[cands])), k)
+				merged_idx, merged = np.hstack((best_idx[rows], cands[found])), np.hstack((best[rows], d))
+				keep, best[rows] = topk(merged, k)
+				best_idx[rows] = merged_idx[np.arange(len(rows)).reshape(-1, 1), keep]
+
+			idx.append(best_idx)
+			dists.append(best)
+
+		return np.vstack(idx), np.vstack(dists)
+
+
+	def save(self, filename):
+		"""
+		Save the index in file filename. The codes stay in their memory-mapped
+		.npy file, which must be kept alongside.
+
+		Args:
+		-----
+			filename: String repr. name of file.
+		"""
+		f = open(filename, 'wb')
+		cpkl.dump({'path': self.path, 'quantize': self.quantize, 'lists': self.no_lists, 'probes': self.probes,
+					'batch_size': self.batch_size, 'scale': self.scale, 'centroids': self.centroids,
+					'order': self.order, 'offsets': self.offsets}, f, cpkl.HIGHEST_PROTOCOL)
+		f.close()
+
+
+	def exact(self, imgs, k=10):
+		"""
+		Find the exact k nearest corpus images to each query image by
+		comparing against every stored code.
+
+		Args:
+		-----
+			imgs: A no_imgs x img_length x img_width x no_channels array of query images.
+			k: Integer repr. no. neighbours.
+
+		Returns:
+		--------
+			no_imgs x k arrays of corpus indices and squared distances.
+		"""
+		idx, dists = [], []
+		for i in xrange(0, imgs.shape[0], self.batch_size):
+			queries = self.encode(imgs[i:i + self.batch_size])
+			best_idx = np.zeros((queries.shape[0], 0), dtype=int)
+			best = np.zeros((queries.shape[0], 0), dtype='float32')
+
+			for j in xrange(0, self.codes.shape[0], self.batch_size):
+				found, d = topk(sqDists(queries, self.decode(self.codes[j:j + self.batch_size])), k)
+				best_idx, best = np.hstack((best_idx, found + j)), np.hstack((best, d))
+				merged, best = topk(best, k)
+				best_idx = best_idx[np.arange(queries.shape[0]).reshape(-1, 1), merged]
+
+			idx.append(best_idx)
+			dists.append(best)
+
+		return np.vstack(idx), np.vstack(dists)
+
+
+def loadIndex(ae, filename):
+	"""
+	Load an index saved in file filename, memory-mapping its codes read-only.
+
+	Args:
+	-----
+		ae: The trained ConvAE the index was built with.
+		filename: String repr. name of file.
+
+	Returns:
+	--------
+		A CodeIndex.
+	"""
+	f = open(filename, 'rb')
+	model = cpkl.load(f)
+	f.close()
+
+	index = CodeIndex(ae, model['path'], model['quantize'], model['lists'], model['probes'], model['batch_size'])
+	index.scale, index.centroids, index.order, index.offsets = model['scale'], model['centroids'], model['order'], model['offsets']
+	index.codes = np.load(index.path, mmap_mode='r')
+	return index
+
+
+def recall(found, truth):
+	"""
+	Find the fraction of the true neighbours that were found.
+
+	Args:
+	-----
+		found: A q x k array of found indices.
+		truth: A q x k array of true indices.
+
+	Returns:
+	--------
+		The recall averaged over all queries.
+	"""
+	return np.mean([len(np.intersect1d(f, t)) / float(len(t)) for f, t in zip(found, truth)])
@@ -0,0 +1,123 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import threading
+import cPickle as cpkl
+
+
+class StateWriter():
+	"""
+	Writes training state snapshots on a background thread.
+	"""
+
+	def __init__(self, filename):
+		"""
+		Initialize the state writer and start its writer thread.
+
+		Args:
+		-----
+			filename: String repr. name of the snapshot file.
+		"""
+		self.filename = filename
+		self.pending, self.closed, self.error = None, False, None
+		self.cond = threading.Condition()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+
+	def save(self, state):
+		"""
+		Queue a snapshot to be written. Never waits on the writer; if it is
+		still busy, a snapshot queued earlier and not yet started is replaced.
+
+		Args:
+		-----
+			state: A picklable training state. Must not be modified afterwards.
+		"""
+		if self.error is not None:
+			raise self.error
+
+		with self.cond:
+			self.pending = state
+			self.cond.notify()
+
+
+	def run(self):
+		"""
+		Write queued snapshots until closed.
+		"""
+		while True:
+			with self.cond:
+				while self.pending is None and not self.closed:
+					self.cond.wait()
+				if self.pending is None:
+					return
+				state, self.pending = self.pending, None
+
+			try:
+				saveState(state, self.filename)
+			except Exception as ex:
+				self.error = ex
+
+
+	def close(self):
+		"""
+		Write any queued snapshot and stop the writer thread.
+		"""
+		with self.cond:
+			self.closed = True
+			self.cond.notify()
+		self.thread.join()
+
+		if self.error is not None:
+			raise self.error
+
+
+def saveState(state, filename):
+	"""
+	Atomically write a training state, so a crash mid-write leaves the
+	previous snapshot intact.
+
+	Args:
+	-----
+		state: A picklable training state.
+		filename: String repr. name of the snapshot file.
+	"""
+	tmp = filename + '.tmp'
+	f = open(tmp, 'wb')
+	cpkl.dump(state, f, cpkl.HIGHEST_PROTOCOL)
+	f.flush()
+	os.fsync(f.fileno())
+	f.close()
+	os.rename(tmp, filename)
+
+
+def loadState(filename):
+	"""
+	Read a training state.
+
+	Args:
+	-----
+		filename: String repr. name of the snapshot file.
+
+	Returns:
+	--------
+		The training state.
+	"""
+	f = open(filename, 'rb')
+	state = cpkl.load(f)
+	f.close()
+	return state
@@ -0,0 +1,206 @@
+# Copyright (c) 2015 ev0
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import sys
+import time
+import random
+import tempfile
+import itertools
+import numpy as np
+from copy import deepcopy
+from multiprocessing import Pool
+from convae import *
+import convae
+
+
+_data, _valid, _test = None, None, None # memory-mapped datasets of each worker.
+
+
+def grid(space):
+	"""
+	Enumerate every combination of the given hyperparameter values.
+
+	Args:
+	-----
+		space: A dictionary mapping each hyperparameter to a list of values.
+
+	Returns:
+	--------
+		A list of hyperparameter dictionaries.
+	"""
+	names = sorted(space)
+	return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+
+def randomSearch(space, trials):
+	"""
+	Sample hyperparameter values at random.
+
+	Args:
+	-----
+		space: A dictionary mapping each hyperparameter to a list of values to
+			choose from, a (low, high) tuple to sample uniformly or a
+			(low, high, 'log') tuple to sample log-uniformly.
+		trials: Integer repr. no. configurations to sample.
+
+	Returns:
+	--------
+		A list of hyperparameter dictionaries.
+	"""
+	configs = []
+	for i in xrange(trials):
+		config = {}
+		for name, values in space.items():
+			if isinstance(values, list):
+				config[name] = random.choice(values)
+			elif len(values) == 3 and values[2] == 'log':
+				config[name] = float(np.exp(random.uniform(np.log(values[0]), np.log(values[1]))))
+			else:
+				config[name] = random.uniform(values[0], values[1])
+		configs.append(config)
+
+	return configs
+
+
+def initWorker(data_path, test_path, valid_split, threads):
+	"""
+	Open the shared datasets read-only in a worker process and set up its
+	worker threads.
+
+	Args:
+	-----
+		data_path: String repr. the .npy file of training images.
+		test_path: String repr. the .npy file of test images.
+		valid_split: Float repr. fraction of the training images held out to rank trials.
+		threads: Integer repr. no. worker threads each process shards its layer ops over.
+	"""
+	global _data, _valid, _test
+
+	# a thread pool forked from the parent has no threads in this process, so
+	# it would block forever; drop it without closing or joining it.
+	convae._pool, convae._threads = None, 1
+	if threads > 1:
+		setThreads(threads)
+
+	data = np.load(data_path, mmap_mode='r')
+	n = max(1, int(data.shape[0] * valid_split))
+	_data, _valid, _test = data[:-n], data[-n:], np.load(test_path, mmap_mode='r')
+	sys.stdout = open(os.devnull, 'w') # keep the training logs of trials quiet.
+
+
+def runTrial(trial):
+	"""
+	Continue training a trial for its next rung of epochs.
+
+	Args:
+	-----
+		trial: A dictionary holding the trial's 'params', network 'layers',
+			'itrs' trained so far and no. 'epochs' to train for.
+
+	Returns:
+	--------
+		The trial updated with its trained layers, validation and test
+		reconstruction errors and wall time.
+	"""
+	start = time.time()
+
+	ae = ConvAE()
+	ae.layers = trial['layers']
+	params = dict(trial['params'], epochs=trial['epochs'], view_errors=False, view_kernels=False, view_recon=False)
+	trial['valid_error'] = ae.train(_data, _valid, params, (0, 0), itrs=trial['itrs'])
+	trial['test_error'] = ae.evaluate(ae.layers, _test, params['batch_size'])
+	trial['layers'], trial['itrs'] = ae.layers, ae.itrs
+	trial['wall_time'] = trial['wall_time'] + time.time() - start
+
+	return trial
+
+
+def sweep(data, test, layers, params, configs, min_epochs=1, eta=3, processes=None, results='sweep.tsv', directory=None, valid_split=0.1, threads=1):
+	"""
+	Train the network under each hyperparameter configuration on a process
+	pool, using successive halving to stop the losing configurations early.
+	All trials start at min_epochs; after each rung only the best 1/eta
+	(by validation error) carry on, for eta times as many epochs, up to
+	params['epochs'].
+
+	Args:
+	-----
+		data : A no_imgs x img_length x img_width x no_channels array of images.
+		test : A no_imgs x img_length x img_width x no_channels array of images.
+		layers: A list of hierarchically arranged encoding pooling/convolutional layers.
+		params: A dictionary of the training parameters shared by all trials.
+		configs: A list of hyperparameter dictionaries overriding params, as
+			returned by grid or randomSearch.
+		min_epochs: Integer repr. no. epochs every trial is trained for.
+		eta: Integer repr. the factor trials are cut down by at each rung.
+		processes: Integer repr. no. worker processes. Defaults to the no. cpus.
+		results: String repr. the file the tab separated results table is written to.
+		directory: String repr. where the shared datasets are written. Defaults to a temp dir.
+		valid_split: Float repr. fraction of the training images held out to rank trials.
+		threads: Integer repr. no. worker threads each process shards its layer ops
+			over, whatever the calling process uses.
+
+	Returns:
+	--------
+		A list of the finished trials, best first.
+	"""
+	tmp, directory = directory is None, directory or tempfile.mkdtemp()
+	data_path, test_path = os.path.join(directory, 'data.npy'), os.path.join(directory, 'test.npy')
+	np.save(data_path, data)
+	np.save(test_path, test)
+
+	ae = ConvAE()
+	for layer in layers:
+		ae.layers = ae.reflect(layer) + ae.layers + [layer]
+
+	trials = [{'id': i, 'config': config, 'params': dict(params, **config), 'layers': deepcopy(ae.layers),
+				'itrs': 0, 'trained': 0, 'wall_time': 0.0} for i, config in enumerate(configs)]
+	finished, budget = {}, min(min_epochs, params['epochs'])
+
+	pool = Pool(processes, initWorker, (data_path, test_path, valid_split, threads))
+	while True:
+
+		print "Training {:d} trials to {:d} epochs...".format(len(trials), budget)
+		for trial in trials:
+			trial['epochs'] = budget - trial['trained']
+		trials = pool.map(runTrial, trials, 1)
+
+		for trial in trials:
+			trial['trained'] = budget
+			finished[trial['id']] = trial
+
+		if budget >= params['epochs'] or len(trials) == 1:
+			break
+		trials = sorted(trials, key=lambda trial: trial['valid_error'])[:max(1, len(trials) / eta)]
+		budget = min(budget * eta, params['epochs'])
+
+	pool.close()
+	pool.join()
+	if tmp:
+		os.remove(data_path)
+		os.remove(test_path)
+		os.rmdir(directory)
+
+	finished = sorted(finished.values(), key=lambda trial: (-trial['trained'], trial['valid_error']))
+	names = sorted(set(name for trial in finished for name in trial['config']))
+	f = open(results, 'w')
+	f.write('\t'.join(['trial'] + names + ['epochs', 'valid_error', 'test_error', 'wall_time']) + '\n')
+	for trial in finished:
+		row = [trial['id']] + [trial['config'].get(name, '') for name in names]
+		row = row + [trial['trained'], trial['valid_error'], trial['test_error'], trial['wall_time']]
+		f.write('\t'.join(str(value) for value in row) + '\n')
+	f.close()
+
+	return finished
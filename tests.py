@@ -12,8 +12,449 @@
 # ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import os
+import sys
+import resource
+import tempfile
+import threading
+import subprocess
+import cPickle as cpkl
 import numpy as np
 from convae import *
+from plan import freeze
+from retrieval import CodeIndex, loadIndex, recall
+from sweep import sweep, grid
+
+def autoencoder(layers):
+	"""
+	Return a ConvAE whose layers are the given encoders and their reflections,
+	with small random biases so that every layer shifts its input.
+	"""
+
+	ae = ConvAE()
+	for layer in layers:
+		ae.layers = ae.reflect(layer) + ae.layers + [layer]
+	for layer in ae.layers:
+		if isinstance(layer, ConvLayer):
+			layer.bias += 0.1 * np.random.randn(*layer.bias.shape)
+	return ae
+
+
+def grads(ae):
+	"""
+	Return copies of the error gradients of every ConvLayer of ae.
+	"""
+
+	return [(layer.dEdw.copy(), layer.dEdb.copy()) for layer in ae.layers if isinstance(layer, ConvLayer)]
+
+
+def assertClose(a, b, tol, msg):
+	"""
+	Assert that arrays a & b have the same shape and differ by at most tol
+	relative to the largest magnitude in a. Theano convolves in float32.
+	"""
+
+	assert np.any(a), msg + ": the network outputs only zeros, so nothing is checked"
+	assert a.shape == b.shape, msg + ": shapes " + str(a.shape) + " and " + str(b.shape) + " differ"
+	assert np.max(np.abs(a - b)) <= tol * np.max(np.abs(a)), msg
+
+
+def trainParams(**extra):
+	"""
+	Return quiet training hyperparams for small test runs, updated with extra.
+	"""
+
+	params = {
+		'epochs': 2,
+		'batch_size': 100,
+		'view_kernels': False,
+		'view_recon': False,
+		'view_errors': False,
+		'pert_prob': 0.5,
+		'eps_w': 0.005,
+		'eps_b': 0.005,
+		'eps_decay': 9,
+		'eps_intvl': 10,
+		'eps_satr': 'inf',
+		'mu': 0.7,
+		'l2': 0.95,
+		'RMSProp': True,
+		'RMSProp_decay': 0.9,
+		'minsq_RMSProp': 0.01,
+	}
+	params.update(extra)
+	return params
+
+
+def stepGrowth(layers, shape, batch, params, threads):
+	"""
+	Run one training step of a ConvAE with the given layers on a batch of
+	random images and print the bytes the peak RSS of the process grew by.
+	Run by stepPeak in an interpreter of its own.
+	"""
+
+	ae = ConvAE(threads)
+	ae.layers = layers
+	spacing, scale = ae.checkpointSpacing(params), 2 ** 10 if params.get('mixed_precision') else 1
+	params = dict(params, pert_prob=0.5)
+	imgs = np.random.rand(batch, *shape)
+
+	ae.accumulate(imgs[:2], params, 2, spacing, scale) # compile the convolutions.
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	ae.accumulate(imgs, params, batch, spacing, scale)
+	grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+	print grown * (1 if sys.platform == 'darwin' else 1024) # KB on Linux.
+
+
+def stepPeak(ae, shape, batch, params, threads=1):
+	"""
+	Return the bytes the peak RSS grows by in a training step of ae, measured
+	in a fresh interpreter so that no memory freed by earlier tests is reused.
+	"""
+
+	for layer in ae.layers:
+		if isinstance(layer, ConvLayer):
+			layer.storeType = 'float16' if params.get('mixed_precision') else None
+
+	code = 'import sys, cPickle, tests; tests.stepGrowth(*cPickle.load(sys.stdin))'
+	child = subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+								cwd=os.path.dirname(os.path.abspath(__file__)))
+	out = child.communicate(cpkl.dumps((ae.layers, shape, batch, params, threads), cpkl.HIGHEST_PROTOCOL))[0]
+	assert child.returncode == 0, "the training step failed"
+	return int(out.split()[-1])
+
+
+def testThreads():
+	"""
+	Test that sharding the layer ops over worker threads gives the outputs
+	and gradients of running them on one thread.
+	"""
+
+	print "Checking the sharded layer ops..."
+	np.random.seed(0)
+	imgs = np.random.rand(7, 26, 26, 1)
+	ae = autoencoder([PoolLayer((2, 2), 'avg'), ConvLayer(4, 6, (3, 3), 'sigmoid'), PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (3, 3), 'tanh', init_w=0.1)])
+
+	outputs = []
+	for threads in [1, 3]:
+		setThreads(threads)
+		out = ae.feedf(ae.layers, imgs)
+		ae.backprop(out - imgs)
+		outputs.append((out, grads(ae)))
+	setThreads(1)
+
+	(out, plain), (sharded_out, sharded) = outputs
+	assert np.any(out) and np.array_equal(out, sharded_out), "sharded outputs differ"
+	for (w, b), (sw, sb) in zip(plain, sharded):
+		assert np.array_equal(w, sw) and np.array_equal(b, sb), "sharded gradients differ"
+
+	print "Sharded layer ops OK."
+
+
+def testActivations():
+	"""
+	Test each registered derivative against finite differences of its
+	activation, and softmax on logits too large to exponentiate.
+	"""
+
+	print "Checking the activations..."
+	np.random.seed(0)
+	data, dEdo, h = np.random.randn(4, 50), np.random.randn(4, 50), 1e-6
+	data[np.abs(data) < 1e-3] = 0.5 # keep relu away from its kink.
+
+	for name, (func, deriv) in ACTIVATIONS.items():
+		numeric = dEdo * (func(data + h) - func(data - h)) / (2 * h)
+		assert np.allclose(deriv(func(data), dEdo), numeric, atol=1e-6), "the derivative of " + name + " is wrong"
+
+	logits = 1000 * data
+	probs = softmax(logits)
+	assert np.all(np.isfinite(probs)) and np.allclose(np.sum(probs, axis=0), 1), "softmax overflows on large logits"
+	assert np.allclose(probs, softmax(logits - 900)), "softmax is not shift invariant"
+	assert np.allclose(sech2(tanh(data)), 1 / np.cosh(data) ** 2), "sech2 is wrong"
+
+	print "Activations OK."
+
+
+def testEarlyStopping():
+	"""
+	Test that training stops once the validation error fails to improve for
+	patience validations, and that the kernels of the best validation are
+	restored.
+	"""
+
+	print "Checking early stopping..."
+	data, test = np.random.rand(330, 34, 34, 1), np.random.rand(50, 34, 34, 1)
+	encoders = lambda: [PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (7, 7), stride=3)]
+
+	# no later validation improves on the first by min_delta, so the first is best.
+	for patience in [1, 2]:
+		np.random.seed(0)
+		ae = autoencoder(encoders())
+		ae.train(data, test, trainParams(epochs=10, valid_intvl=1, valid_split=0.1, patience=patience, min_delta=1e9), (0, 0))
+		assert ae.itrs == 3 * (patience + 1), "training did not stop after {:d} failed validations".format(patience)
+
+		np.random.seed(0)
+		best = autoencoder(encoders())
+		best.train(data, test, trainParams(epochs=1, valid_intvl=1, valid_split=0.1), (0, 0))
+		for layer, kept in zip(ae.layers, best.layers):
+			if isinstance(layer, ConvLayer):
+				assert np.array_equal(layer.kernels, kept.kernels) and np.array_equal(layer.bias, kept.bias), "the best kernels were not restored"
+
+	print "Early stopping OK."
+
+
+def testMixedPrecision():
+	"""
+	Test that float16 storage lowers the estimated peak memory of a step,
+	that unscale rejects overflowed gradients and divides out the scale of
+	the rest, and that training halves the loss scale on overflow and
+	doubles it, up to max_loss_scale, after scale_window good steps.
+	"""
+
+	print "Checking mixed precision..."
+	np.random.seed(0)
+	encoders = lambda: [PoolLayer((2, 2), 'max'), ConvLayer(8, 4, (3, 3), init_w=0.1), ConvLayer(4, 1, (3, 3), 'sigmoid', init_w=0.1)]
+	ae = autoencoder(encoders())
+	full, mixed = ae.estimateMemory((64, 64, 1), 100), ae.estimateMemory((64, 64, 1), 100, {'mixed_precision': True})
+	assert mixed['peak'] < 0.9 * full['peak'], "float16 storage does not lower the peak memory"
+
+	data = np.random.rand(20, 30, 30, 1)
+	for layer in ae.layers:
+		if isinstance(layer, ConvLayer):
+			layer.storeType = 'float16'
+	ae.accumulate(data, {'pert_prob': 1.0}, 20)
+	plain = grads(ae)
+
+	ae.accumulate(data, {'pert_prob': 1.0}, 20, scale=2.0 ** 200) # inf in float32.
+	overflowed = [(layer.dEdw, layer.dEdb) for layer in ae.layers if isinstance(layer, ConvLayer)]
+	assert not ae.unscale(2.0 ** 200), "overflowed gradients were not rejected"
+	for (w, b), layer in zip(overflowed, [layer for layer in ae.layers if isinstance(layer, ConvLayer)]):
+		assert layer.dEdw is w and layer.dEdb is b, "rejected gradients were changed"
+
+	ae.accumulate(data, {'pert_prob': 1.0}, 20, scale=1024)
+	assert ae.unscale(1024), "finite gradients were rejected"
+	for (w, b), (sw, sb) in zip(plain, grads(ae)):
+		assertClose(w, sw, 1e-3, "unscaled weight gradients differ")
+		assertClose(b, sb, 1e-3, "unscaled bias gradients differ")
+
+	data, test = np.random.rand(300, 34, 34, 1), np.random.rand(50, 34, 34, 1)
+	save_file = os.path.join(tempfile.mkdtemp(), 'train.state')
+	params = trainParams(mixed_precision=True, loss_scale=4, scale_window=1, max_loss_scale=16, save_file=save_file, save_intvl=1)
+
+	ae = autoencoder(encoders())
+	ae.train(data, test, params, (0, 0))
+	assert loadState(save_file)['scale'] == 16, "the loss scale did not double up to max_loss_scale"
+
+	ae = autoencoder(encoders())
+	ae.unscale = lambda scale: False # every step overflows.
+	kernels = ae.getParams()
+	ae.train(data, test, params, (0, 0))
+	assert loadState(save_file)['scale'] == 4 / 2.0 ** 6, "the loss scale was not halved on each overflow"
+	for (w, b), (kw, kb) in zip(kernels, ae.getParams()):
+		assert np.array_equal(w, kw) and np.array_equal(b, kb), "an overflowed step updated the kernels"
+
+	print "Mixed precision OK."
+
+
+def testCheckpointing():
+	"""
+	Test that the gradients found by recomputing activations from checkpoints
+	are those of a plain backprop, at several checkpoint spacings.
+	"""
+
+	print "Checking checkpointed gradients..."
+	np.random.seed(0)
+	imgs = np.random.rand(6, 20, 20, 1)
+	ae = autoencoder([PoolLayer((2, 2), 'max'), ConvLayer(8, 6, (3, 3)), ConvLayer(6, 1, (3, 3))])
+
+	ae.backprop(ae.feedf(ae.layers, imgs) - imgs)
+	plain = grads(ae)
+	for spacing in [1, 2, 3]:
+		ae.backprop(ae.feedf(ae.layers, imgs, spacing=spacing) - imgs)
+		for (w, b), (cw, cb) in zip(plain, grads(ae)):
+			assertClose(w, cw, 1e-12, "checkpointed weight gradients differ at spacing " + str(spacing))
+			assertClose(b, cb, 1e-12, "checkpointed bias gradients differ at spacing " + str(spacing))
+
+	print "Checkpointing OK."
+
+
+def testMicroBatches():
+	"""
+	Test that the gradients accumulated over micro-batches are those of the
+	whole batch.
+	"""
+
+	print "Checking micro-batch gradients..."
+	np.random.seed(0)
+	data = np.random.rand(40, 23, 23, 1)
+	ae = autoencoder([PoolLayer((2, 2), 'max'), ConvLayer(8, 4, (3, 3), stride=2), ConvLayer(4, 1, (3, 3))])
+	params = {'pert_prob': 1.0} # no noise, so that every micro-batch sees the same images.
+
+	error = ae.accumulate(data, params, 40)
+	whole = grads(ae)
+	for micro in [7, 20]:
+		assert abs(ae.accumulate(data, params, micro) - error) <= 1e-5 * error, "micro-batch errors differ"
+		for (w, b), (mw, mb) in zip(whole, grads(ae)):
+			assertClose(w, mw, 1e-5, "micro-batch weight gradients differ at " + str(micro) + " images")
+			assertClose(b, mb, 1e-5, "micro-batch bias gradients differ at " + str(micro) + " images")
+
+	print "Micro-batches OK."
+
+
+def testMaxUnpool():
+	"""
+	Test maxunpool against routing the errors with a dense mask of the maxima.
+	"""
+
+	print "Checking maxunpool..."
+	np.random.seed(0)
+	for factor in [(2, 2), (3, 2)]:
+		data = np.random.rand(3, 4, 6 * factor[0], 5 * factor[1])
+		pooled, positions = maxpool(data, factor)
+		dEdo = np.random.randn(*pooled.shape)
+
+		mask = data == np.kron(pooled, np.ones(factor))
+		dense = np.kron(dEdo, np.ones(factor)) * mask
+		assert np.array_equal(maxunpool(dEdo, positions, factor), dense), "maxunpool differs from the dense version"
+
+	print "Maxunpool OK."
+
+
+def testFrozenPlan():
+	"""
+	Test that a frozen plan feeds images through as the network does.
+	"""
+
+	print "Checking the frozen plan..."
+	np.random.seed(0)
+	imgs = np.random.rand(4, 24, 24, 1)
+	for layers in [[PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (5, 5), init_w=0.1)], [ConvLayer(6, 4, (3, 3), 'sigmoid', stride=2), PoolLayer((2, 2), 'avg'), ConvLayer(4, 1, (3, 3), 'sigmoid')]]:
+		ae = autoencoder(layers)
+		assertClose(ae.feedf(ae.layers, imgs, False), freeze(ae.layers, imgs.shape).run(imgs), 1e-5, "the frozen plan differs from feedf")
+
+	print "Frozen plan OK."
+
+
+def testRetrieval():
+	"""
+	Test the recall of index queries against exact search, with float32 and
+	int8 codes, and that a saved & reloaded index answers as the original.
+	"""
+
+	print "Checking the code index..."
+	np.random.seed(0)
+	corpus, queries = np.random.rand(600, 20, 20, 1), np.random.rand(40, 20, 20, 1)
+	ae = autoencoder([PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (3, 3), 'linear', init_w=0.1)])
+	tmp = tempfile.mkdtemp()
+
+	for quantize in [False, True]:
+		index = CodeIndex(ae, os.path.join(tmp, 'codes.npy'), quantize, lists=8, probes=8, batch_size=128)
+		index.build(corpus)
+		assert os.listdir(tmp) == ['codes.npy'], "build left files behind"
+		truth, dists = index.exact(queries, 5)
+
+		found, found_dists = index.query(queries, 5) # probing every list is an exact search.
+		assert recall(found, truth) == 1 and np.allclose(found_dists, dists), "probing every list misses neighbours"
+		index.probes = 3
+		found, found_dists = index.query(queries, 5)
+		assert recall(found, truth) > 0.5, "probing the nearest lists misses most neighbours"
+
+		index.save(os.path.join(tmp, 'codesIndex'))
+		loaded = loadIndex(ae, os.path.join(tmp, 'codesIndex'))
+		loaded_found, loaded_dists = loaded.query(queries, 5)
+		assert np.array_equal(loaded_found, found) and np.array_equal(loaded_dists, found_dists), "the reloaded index answers differently"
+		del index, loaded # close the memory maps.
+		os.remove(os.path.join(tmp, 'codesIndex'))
+
+	print "Code index OK."
+
+
+def testTiledFeedf():
+	"""
+	Test that feeding large images through in tiles gives what feeding them
+	whole does, for sizes aligned to the strides of the network.
+	"""
+
+	print "Checking tiled feedf..."
+	np.random.seed(0)
+	for layers, tile in [([PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (5, 5))], 32), ([PoolLayer((2, 2), 'max'), ConvLayer(6, 4, (3, 3), stride=2, init_w=0.1), ConvLayer(4, 1, (5, 5), init_w=0.1)], 64)]:
+		ae = autoencoder(layers)
+		for size in [96, 100]:
+			imgs = np.random.rand(2, size, size, 1)
+			assertClose(ae.feedf(ae.layers, imgs, False), ae.tiledFeedf(ae.layers, imgs, tile), 1e-5, "tiled feedf differs at " + str(size) + " pixels")
+
+	print "Tiled feedf OK."
+
+
+def testSweep():
+	"""
+	Test a sweep run after the calling process has started worker threads,
+	which forked worker processes must not inherit, with and without
+	threads of their own.
+	"""
+
+	print "Checking the hyperparameter sweep..."
+	np.random.seed(0)
+	data, test = np.random.rand(120, 20, 20, 1), np.random.rand(20, 20, 20, 1)
+	results = os.path.join(tempfile.mkdtemp(), 'sweep.tsv')
+	configs = grid({'mu': [0.5, 0.7], 'eps_w': [0.001, 0.005]})
+
+	setThreads(2)
+	for threads in [1, 2]:
+		finished = []
+		run = lambda: finished.extend(sweep(data, test, [PoolLayer((2, 2), 'max'), ConvLayer(4, 1, (3, 3))], trainParams(epochs=3, batch_size=50), configs, processes=2, results=results, threads=threads))
+		worker = threading.Thread(target=run)
+		worker.daemon = True
+		worker.start()
+		worker.join(120)
+		assert not worker.is_alive(), "the sweep hangs"
+
+		assert sorted(trial['id'] for trial in finished) == range(len(configs)), "trials went missing"
+		assert finished[0]['trained'] == 3 and len(open(results).readlines()) == len(configs) + 1, "the results are incomplete"
+	setThreads(1)
+
+	print "Sweep OK."
+
+
+def testResume():
+	"""
+	Test that a run resumed from a snapshot ends where the uninterrupted
+	run does.
+	"""
+
+	print "Checking resumed training..."
+	np.random.seed(0)
+	data, test = np.random.rand(300, 34, 34, 1), np.random.rand(50, 34, 34, 1)
+	params = {
+		'epochs': 2,
+		'batch_size': 100,
+		'view_kernels': False,
+		'view_recon': False,
+		'view_errors': False,
+		'pert_prob': 0.5,
+		'eps_w': 0.005,
+		'eps_b': 0.005,
+		'eps_decay': 9,
+		'eps_intvl': 10,
+		'eps_satr': 'inf',
+		'mu': 0.7,
+		'l2': 0.95,
+		'RMSProp': True,
+		'RMSProp_decay': 0.9,
+		'minsq_RMSProp': 0.01,
+		'save_file': os.path.join(tempfile.mkdtemp(), 'train.state'),
+		'save_intvl': 4
+	}
+
+	ae = autoencoder([PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (7, 7), stride=3)])
+	whole = ae.train(data, test, params, (0, 0))
+
+	ae = autoencoder([PoolLayer((2, 2), 'max'), ConvLayer(6, 1, (7, 7), stride=3)])
+	resumed = ae.train(data, test, dict(params, save_file=None), (0, 0), resume_from=params['save_file'])
+	assert resumed == whole, "the resumed run ends at {:g}, not {:g}".format(resumed, whole)
+
+	print "Resumed training OK."
+
 
 def testMnist():
 	"""
@@ -109,7 +550,89 @@ def testTorontoFaces():
 	ae.train(train_data, test_data, layers, hyperparams)
 
 
+def testMemoryEstimate():
+	"""
+	Test that the bytes per image the memory estimate says each layer keeps
+	for backprop match the arrays the layers actually keep after a feedf.
+	"""
+
+	print "Checking the memory estimate of the stored activations..."
+	np.random.seed(0)
+	imgs = np.random.rand(10, 50, 50, 1)
+	encoders = [
+				[PoolLayer((2, 2), 'max'), ConvLayer(8, 4, (3, 3), stride=2), PoolLayer((2, 2), 'avg'), ConvLayer(4, 1, (3, 3))],
+				[ConvLayer(8, 6, (3, 3)), ConvLayer(6, 4, (3, 3)), ConvLayer(4, 1, (3, 3))]
+			]
+
+	for layers in encoders:
+		for mixed in [False, True]:
+			ae = ConvAE()
+			for layer in layers:
+				ae.layers = ae.reflect(layer) + ae.layers + [layer]
+			for layer in ae.layers:
+				if isinstance(layer, ConvLayer):
+					layer.storeType = 'float16' if mixed else None
+
+			ae.feedf(ae.layers, imgs)
+			seen, stored = set(), 0
+			for layer in ae.layers:
+				kept = [layer.x, layer.y] if isinstance(layer, ConvLayer) else [layer.positions]
+				for array in kept:
+					while array is not None and array.base is not None:
+						array = array.base
+					if array is not None and id(array) not in seen and array is not imgs:
+						seen.add(id(array))
+						stored = stored + array.nbytes
+
+			report = ae.estimateMemory(imgs.shape[1:], imgs.shape[0], {'mixed_precision': mixed})
+			assert sum(report['stored']) * imgs.shape[0] == stored, "stored bytes do not match the estimate"
+
+	print "Memory estimate OK."
+
+
+def testMemoryPeak():
+	"""
+	Test that the peak memory of a training step, measured in a fresh process,
+	does not exceed the estimate, with checkpointing, mixed precision and
+	worker threads.
+	"""
+
+	print "Measuring the peak memory of training steps..."
+	np.random.seed(0)
+	encoders = [
+				([PoolLayer((2, 2), 'avg'), ConvLayer(8, 1, (5, 5), 'tanh')], 64),
+				([PoolLayer((2, 2), 'max'), ConvLayer(6, 4, (3, 3), stride=2), ConvLayer(4, 1, (5, 5), 'sigmoid')], 65)
+			]
+	options = [({}, 1), ({'checkpoint': 1}, 1), ({'mixed_precision': True}, 1), ({}, 4),
+				({'mixed_precision': True, 'checkpoint': 2}, 4)]
+
+	for layers, size in encoders:
+		for params, threads in options:
+			ae = autoencoder(layers)
+			setThreads(threads)
+			report = ae.estimateMemory((size, size, 1), 400, params)
+			setThreads(1)
+			grown = stepPeak(ae, (size, size, 1), 400, params, threads)
+			assert grown <= report['peak'], "a step with %s and %d threads used %d bytes, estimated %d" % (params, threads, grown, report['peak'])
+
+	print "Memory peak OK."
+
+
 if __name__ == '__main__':
 
+	testThreads()
+	testActivations()
+	testEarlyStopping()
+	testMixedPrecision()
+	testCheckpointing()
+	testMicroBatches()
+	testMaxUnpool()
+	testFrozenPlan()
+	testRetrieval()
+	testTiledFeedf()
+	testSweep()
+	testResume()
+	testMemoryEstimate()
+	testMemoryPeak()
 	testMnist()
 	testTorontoFaces()
\ No newline at end of file